@@ -0,0 +1,158 @@
+import functools
+import json
+
+# Packs agent outputs into an LLM prompt context under an explicit token budget. Items carry a
+# priority; list/dict items are offered element by element (in their own order, e.g. most common
+# first), so at equal priority the first element of every item goes in before any second one.
+# Candidates are added greedily, highest priority first, while they fit, and the result is
+# serialized as compact JSON. Tokens are counted with tiktoken when its encoding is available
+# locally, otherwise estimated at ~4 characters per token.
+
+# Tokens of packed context allowed per prompt, by model. The prompt template and the completion
+# (max_tokens) come on top, so these stay well below the model's context window.
+CONTEXT_BUDGETS = {'usf1-mini': 3000}
+DEFAULT_CONTEXT_BUDGET = 2000
+ENCODING = 'cl100k_base'
+# below this many remaining tokens a long string is dropped rather than truncated
+MIN_TRUNCATED_TOKENS = 32
+
+
+def context_budget(model):
+    return CONTEXT_BUDGETS.get(model, DEFAULT_CONTEXT_BUDGET)
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(ENCODING)
+    except Exception as e:  # not installed, or the encoding file cannot be fetched offline
+        print(f"[ContextPacker] tiktoken unavailable ({type(e).__name__}); estimating tokens from length.")
+        return None
+
+
+def count_tokens(text):
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def compact_json(obj):
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=str)
+
+
+def _truncate(text, max_tokens):
+    """Longest prefix of `text` (plus an ellipsis) within `max_tokens`."""
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(compact_json(text[:mid] + '…')) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo] + '…' if lo else None
+
+
+def _shrink(element, max_tokens):
+    """Fit a string, or a flat dict's longest string, into `max_tokens` by truncating it; None if it can't."""
+    if max_tokens < MIN_TRUNCATED_TOKENS:
+        return None
+    if isinstance(element, str):
+        return _truncate(element, max_tokens)
+    if isinstance(element, dict):
+        strings = [k for k, v in element.items() if isinstance(v, str)]
+        if not strings:
+            return None
+        longest = max(strings, key=lambda k: len(element[k]))
+        rest = count_tokens(compact_json(dict(element, **{longest: ''})))
+        text = _truncate(element[longest], max_tokens - rest)
+        return dict(element, **{longest: text}) if text else None
+    return None
+
+
+class ContextPacker:
+    """
+    Usage:
+        packer = ContextPacker(budget)
+        packer.add(('analysis_results', 'suggestions'), suggestions, priority=7)
+        context = packer.pack()   # nested dict, within budget; packer.tokens is its size
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.tokens = 0
+        self.dropped = 0
+        self._items = []
+
+    def add(self, path, value, priority, limit=None, truncate=False):
+        """
+        Offer `value` at `path` (tuple of keys) in the packed context.
+        Args:
+            priority (int): higher is packed first
+            limit (int, optional): at most this many elements of a list/dict value
+            truncate (bool): long strings (or a dict element's longest string) may be cut to fit
+        """
+        if value is None or (isinstance(value, (list, dict)) and not value):
+            return self
+        if isinstance(value, dict):
+            elements = list(value.items())
+        elif isinstance(value, list):
+            elements = list(enumerate(value))
+        else:
+            elements = [(None, value)]
+        self._items.append({'path': tuple(path), 'value': value, 'priority': priority,
+                            'elements': elements[:limit] if limit is not None else elements,
+                            'truncate': truncate})
+        return self
+
+    def _assemble(self, chosen):
+        context = {}
+        for item_index, item in enumerate(self._items):
+            picked = [chosen[(item_index, i)] for i in range(len(item['elements'])) if (item_index, i) in chosen]
+            if not picked:
+                continue
+            if isinstance(item['value'], dict):
+                value = dict(picked)
+            elif isinstance(item['value'], list):
+                value = [v for _, v in picked]
+            else:
+                value = picked[0][1]
+            node = context
+            for key in item['path'][:-1]:
+                node = node.setdefault(key, {})
+            node[item['path'][-1]] = value
+        return context
+
+    def pack(self):
+        """Greedily fill the budget; returns the packed context (serialize with compact_json)."""
+        candidates = sorted(
+            ((item_index, i) for item_index, item in enumerate(self._items) for i in range(len(item['elements']))),
+            key=lambda c: (-self._items[c[0]]['priority'], c[1], c[0]))
+        chosen, order, used, opened = {}, [], count_tokens('{}'), set()
+        for item_index, i in candidates:
+            item = self._items[item_index]
+            key, element = item['elements'][i]
+            prefix = compact_json(str(key)) + ':' if isinstance(item['value'], dict) else ''
+            overhead = count_tokens(compact_json(list(item['path']))) if item_index not in opened else 0
+            cost = overhead + count_tokens(prefix + compact_json(element) + ',')
+            if used + cost > self.budget and item['truncate']:
+                element = _shrink(element, self.budget - used - overhead - count_tokens(prefix + ','))
+                if element is not None:
+                    cost = overhead + count_tokens(prefix + compact_json(element) + ',')
+            if element is None or used + cost > self.budget:
+                self.dropped += 1
+                continue
+            chosen[(item_index, i)] = (key, element)
+            order.append((item_index, i))
+            opened.add(item_index)
+            used += cost
+        # the per-element costs are an estimate; drop the lowest-priority picks until the real size fits
+        context = self._assemble(chosen)
+        self.tokens = count_tokens(compact_json(context))
+        while self.tokens > self.budget and order:
+            del chosen[order.pop()]
+            self.dropped += 1
+            context = self._assemble(chosen)
+            self.tokens = count_tokens(compact_json(context))
+        return context
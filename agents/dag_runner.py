@@ -0,0 +1,66 @@
+import asyncio
+import inspect
+import time
+
+
+class Stage:
+    """
+    A pipeline step: `func` is called with the results of `deps` (in order) once they are all done.
+    Coroutine functions are awaited; plain functions run in a worker thread, and an
+    awaitable they return (e.g. from a lambda wrapping an async method) is awaited in turn.
+    """
+
+    def __init__(self, name, func, deps=()):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+
+
+async def run_dag(stages):
+    """
+    Run `stages` concurrently, starting each one as soon as its dependencies finish.
+    Returns (results, timings) where both are keyed by stage name and timings holds
+    start/end offsets in seconds from the start of the run.
+    """
+    by_name = {s.name: s for s in stages}
+    for stage in stages:
+        missing = [d for d in stage.deps if d not in by_name]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stage(s): {missing}")
+
+    t0 = time.perf_counter()
+    tasks = {}
+    timings = {}
+
+    async def run(stage):
+        args = [await tasks[d] for d in stage.deps]
+        start = time.perf_counter()
+        if inspect.iscoroutinefunction(stage.func):
+            result = await stage.func(*args)
+        else:
+            result = await asyncio.to_thread(stage.func, *args)
+            if inspect.isawaitable(result):
+                result = await result
+        end = time.perf_counter()
+        timings[stage.name] = {"start": start - t0, "end": end - t0, "duration": end - start}
+        return result
+
+    def schedule(stage, visiting=()):
+        if stage.name in tasks:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"Cycle detected at stage '{stage.name}'")
+        for dep in stage.deps:
+            schedule(by_name[dep], visiting + (stage.name,))
+        tasks[stage.name] = asyncio.ensure_future(run(stage))
+
+    for stage in stages:
+        schedule(stage)
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    results = {name: task.result() for name, task in tasks.items()}
+    return results, timings
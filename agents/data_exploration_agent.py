@@ -1,22 +1,45 @@
 from crewai import Agent
+from agents.dataset_profile import DatasetProfile
+from agents.tracing import traced
 
 class DataExplorationAgent(Agent):
-    def analyze(self, data):
+    @traced('exploration.analyze')
+    def analyze(self, data, profile=None, cluster_problems=False):
         """
         Explore the dataset to find common patterns, rare problems, and data quality issues.
+        With cluster_problems=True, near-duplicate PROBLEM wordings are also grouped
+        (see agents.problem_clustering) and cluster-level frequencies are reported.
         """
-        problem_counts = data['PROBLEM'].value_counts()
+        profile = profile or DatasetProfile(data)
+        problem_counts = profile.value_counts('PROBLEM')
         most_common = problem_counts.head(5).to_dict()
-        unique_problems = data['PROBLEM'].nunique()
+        unique_problems = profile.cardinality('PROBLEM')
         quality_issues = []
-        if data['PROBLEM'].isnull().any():
+        if profile.has_nulls('PROBLEM'):
             quality_issues.append('Missing PROBLEM entries')
-        if data['ACTION'].isnull().any():
+        if profile.has_nulls('ACTION'):
             quality_issues.append('Missing ACTION entries')
         rare_problems = problem_counts[problem_counts == 1].index.tolist()
-        return {
+        summary = {
             "most_common_problems": most_common,
             "unique_problem_count": unique_problems,
             "rare_problems": rare_problems,
             "quality_issues": quality_issues
-        } 
\ No newline at end of file
+        }
+        if cluster_problems:
+            summary["problem_clusters"] = self._problem_clusters(problem_counts)
+        return summary
+
+    @traced('exploration.cluster_problems')
+    def _problem_clusters(self, problem_counts):
+        from agents.problem_clustering import cluster_problems
+        clusters = cluster_problems(problem_counts)
+        cluster_counts = clusters['counts']
+        return {
+            "cluster_count": len(cluster_counts),
+            "most_common_clusters": {
+                label: {"count": int(count), "variants": int(clusters['sizes'][label])}
+                for label, count in cluster_counts.head(5).items()
+            },
+            "rare_clusters": cluster_counts[cluster_counts == 1].index.tolist()
+        }
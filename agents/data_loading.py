@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+# Free-text columns of the maintenance logs; loading them as object dtype makes every
+# value_counts/nunique/groupby/isin in the agents hash Python strings row by row.
+TEXT_COLUMNS = ('PROBLEM', 'ACTION')
+TEXT_MODES = ('object', 'category', 'arrow')
+
+_TRAILING_PUNCT = r'[\s.,;:!]+$'
+
+
+def normalize_text(values):
+    """Upper-case, trim, collapse inner whitespace and drop trailing punctuation."""
+    return (values.str.upper()
+                  .str.strip()
+                  .str.replace(r'\s+', ' ', regex=True)
+                  .str.replace(_TRAILING_PUNCT, '', regex=True))
+
+
+def _normalize_categorical(values):
+    # normalize the (few) categories instead of the (many) rows, then merge categories
+    # that collapse onto the same normalized text
+    cats = values.cat.categories
+    normalized = normalize_text(pd.Series(cats, dtype=object))
+    new_codes, new_cats = pd.factorize(normalized)
+    codes = values.cat.codes.to_numpy()
+    remapped = pd.Series(new_codes).to_numpy()[codes]
+    remapped[codes < 0] = -1
+    return pd.Series(pd.Categorical.from_codes(remapped, categories=new_cats), index=values.index, name=values.name)
+
+
+def value_counts(values, sort=True):
+    """
+    Non-null value counts of `values` with ties in order of first occurrence, whatever the text
+    storage. Categorical value_counts() orders ties (and sort=False output) by category, which
+    read_csv/astype make alphabetical, so 'category' columns are counted from their codes instead.
+    """
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        return values.value_counts(sort=sort)
+    codes = values.cat.codes.to_numpy()
+    codes = codes[codes >= 0]
+    first_seen = pd.unique(codes)
+    counts = pd.Series(np.bincount(codes, minlength=len(values.cat.categories))[first_seen],
+                       index=pd.Index(values.cat.categories[first_seen], name=values.name), name='count')
+    return counts.sort_values(ascending=False, kind='stable') if sort else counts
+
+
+def _text_dtype(mode):
+    if mode == 'category':
+        return 'category'
+    if mode == 'arrow':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("text mode 'arrow' requires pyarrow (pip install pyarrow)")
+        return 'string[pyarrow]'
+    return None
+
+
+def compact_text_columns(data, columns=TEXT_COLUMNS, mode='category', normalize=False):
+    """
+    Convert the text `columns` of `data` (in place) to a dictionary-encoded categorical
+    ('category') or Arrow string ('arrow') dtype, optionally normalizing their values.
+    """
+    if mode not in TEXT_MODES:
+        raise ValueError(f"Unknown text mode '{mode}', expected one of {TEXT_MODES}")
+    dtype = _text_dtype(mode)
+    for col in columns:
+        if col not in data.columns:
+            continue
+        values = data[col]
+        if dtype is not None and str(values.dtype) != dtype:
+            values = values.astype(dtype)
+        if normalize:
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                values = _normalize_categorical(values)
+            else:
+                values = normalize_text(values)
+        data[col] = values
+    return data
+
+
+def load_dataset(path, text_mode='category', normalize=False, columns=TEXT_COLUMNS, **read_csv_kwargs):
+    """
+    Read a maintenance-log CSV with its text columns stored compactly (see compact_text_columns).
+    The parser builds the categorical/Arrow columns directly instead of materializing object arrays first.
+    """
+    if text_mode not in TEXT_MODES:
+        raise ValueError(f"Unknown text mode '{text_mode}', expected one of {TEXT_MODES}")
+    dtype = _text_dtype(text_mode)
+    if dtype is not None:
+        header = pd.read_csv(path, nrows=0, **{k: v for k, v in read_csv_kwargs.items() if k in ('sep', 'encoding')})
+        read_csv_kwargs.setdefault('dtype', {col: dtype for col in columns if col in header.columns})
+    data = pd.read_csv(path, **read_csv_kwargs)
+    return compact_text_columns(data, columns, text_mode, normalize)
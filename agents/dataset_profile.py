@@ -0,0 +1,67 @@
+import pandas as pd
+from agents.data_loading import value_counts
+
+
+class DatasetProfile:
+    """
+    Per-column statistics over a DataFrame, computed lazily and memoized so every agent
+    reads the same value counts, null masks and numeric summaries instead of rescanning the frame.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.n_rows = len(data)
+        self.columns = list(data.columns)
+        self.dtypes = {col: str(dtype) for col, dtype in data.dtypes.items()}
+        self._value_counts = {}
+        self._null_masks = {}
+        self._numeric_summaries = {}
+
+    def value_counts(self, column):
+        """Non-null value counts for `column`, most frequent first (ties in first-seen order)."""
+        if column not in self._value_counts:
+            self._value_counts[column] = value_counts(self.data[column])
+        return self._value_counts[column]
+
+    def null_mask(self, column):
+        if column not in self._null_masks:
+            self._null_masks[column] = self.data[column].isnull()
+        return self._null_masks[column]
+
+    def null_count(self, column):
+        return int(self.null_mask(column).sum())
+
+    def has_nulls(self, column):
+        return self.null_count(column) > 0
+
+    def null_matrix(self):
+        return pd.DataFrame({col: self.null_mask(col) for col in self.columns})
+
+    def cardinality(self, column):
+        return len(self.value_counts(column))
+
+    def is_numeric(self, column):
+        return pd.api.types.is_numeric_dtype(self.data[column])
+
+    @property
+    def numeric_columns(self):
+        return [col for col in self.columns if self.is_numeric(col)]
+
+    def top_counts(self, column, n):
+        """Top-n value counts plus the summed count of everything else."""
+        counts = self.value_counts(column)
+        return counts[:n], counts[n:].sum()
+
+    def numeric_summary(self, column):
+        if column not in self._numeric_summaries:
+            values = self.data[column].dropna()
+            quantiles = values.quantile([0.25, 0.5, 0.75]) if len(values) else pd.Series(dtype=float)
+            self._numeric_summaries[column] = {
+                'count': int(len(values)),
+                'mean': float(values.mean()) if len(values) else None,
+                'std': float(values.std()) if len(values) > 1 else None,
+                'min': float(values.min()) if len(values) else None,
+                'max': float(values.max()) if len(values) else None,
+                'quantiles': {float(q): float(v) for q, v in quantiles.items()},
+            }
+        return self._numeric_summaries[column]
@@ -0,0 +1,36 @@
+import contextlib
+import os
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not serialized across processes
+    fcntl = None
+
+# File helpers shared by the on-disk embedding stores (agents/rag_retriever.py, agents/problem_clustering.py).
+
+
+def save_embeddings(path, embs):
+    with open(path, "wb") as f:
+        np.save(f, embs)
+
+
+def atomic_save(path, writer, *args):
+    """Write `path` through `writer(tmp_path, *args)` and rename it into place, so readers never see a partial file."""
+    tmp_path = path + ".tmp"
+    writer(tmp_path, *args)
+    os.replace(tmp_path, path)
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Exclusive lock on `path` (created if missing) shared by every process using the same file."""
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+
+def group_codes(groups):
+    """Integer group codes of `groups` (-1 for missing), to be shared by group_tests() calls over several columns."""
+    codes, _ = pd.factorize(pd.Series(groups), use_na_sentinel=True)
+    return codes
+
+
+def _group_codes(values, codes, min_group_size):
+    """Drop NaNs (in `values` or `codes`) and groups smaller than `min_group_size`."""
+    values = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype='float64')
+    codes = np.asarray(codes)
+    valid = (codes >= 0) & ~np.isnan(values)
+    values, codes = values[valid], codes[valid]
+    if len(codes) == 0:
+        return values, codes, np.zeros(0, dtype='int64')
+    counts = np.bincount(codes)
+    keep = counts >= min_group_size
+    values, codes = values[keep[codes]], codes[keep[codes]]
+    # renumber the surviving groups 0..k-1
+    remap = np.cumsum(keep) - 1
+    codes = remap[codes]
+    return values, codes, counts[keep]
+
+
+def _one_way_f(values, codes, counts):
+    """One-way ANOVA F statistic from bincount group sums."""
+    from scipy.stats import f as f_dist
+    k, n = len(counts), len(values)
+    means = np.bincount(codes, weights=values, minlength=k) / counts
+    grand = values.mean()
+    ss_between = float((counts * (means - grand) ** 2).sum())
+    ss_within = float(((values - means[codes]) ** 2).sum())
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stat = (ss_between / (k - 1)) / (ss_within / (n - k))
+    return {'statistic': float(stat), 'p_value': float(f_dist.sf(stat, k - 1, n - k))}
+
+
+def _group_medians(values, codes, counts):
+    # one sort by (group, value); each group's median then sits at fixed offsets
+    order = np.lexsort((values, codes))
+    sorted_values = values[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return (sorted_values[starts + (counts - 1) // 2] + sorted_values[starts + counts // 2]) / 2
+
+
+def _kruskal(values, codes, counts):
+    from scipy.stats import chi2, rankdata
+    k, n = len(counts), len(values)
+    ranks = rankdata(values)
+    rank_sums = np.bincount(codes, weights=ranks, minlength=k)
+    h = 12.0 / (n * (n + 1)) * float((rank_sums ** 2 / counts).sum()) - 3 * (n + 1)
+    _, ties = np.unique(values, return_counts=True)
+    correction = 1 - float((ties ** 3 - ties).sum()) / (n ** 3 - n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        h = h / correction
+    return {'statistic': float(h), 'p_value': float(chi2.sf(h, k - 1))}
+
+
+def group_tests(values, codes, min_group_size=2):
+    """
+    Vectorized variance/location tests of `values` across the groups given by `codes`
+    (from group_codes()): Levene (mean-centred), Brown-Forsythe (median-centred, scipy's
+    levene default), one-way ANOVA and Kruskal-Wallis. Returns None when fewer than two
+    groups have at least `min_group_size` non-null values.
+    """
+    values, codes, counts = _group_codes(values, codes, min_group_size)
+    if len(counts) < 2:
+        return None
+    means = np.bincount(codes, weights=values, minlength=len(counts)) / counts
+    medians = _group_medians(values, codes, counts)
+    return {
+        'n_groups': int(len(counts)),
+        'n_values': int(len(values)),
+        'levene': _one_way_f(np.abs(values - means[codes]), codes, counts),
+        'brown_forsythe': _one_way_f(np.abs(values - medians[codes]), codes, counts),
+        'anova': _one_way_f(values, codes, counts),
+        'kruskal': _kruskal(values, codes, counts),
+    }
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import math
+import os
+
+import pandas as pd
+
+from agents.streaming_profile import StreamingProfile
+
+
+def _coarsen(obj, digits):
+    # round numbers to `digits` significant digits so small drifts (a few new rows nudging a
+    # percentage or a p-value) do not count as a change of context
+    if isinstance(obj, dict):
+        return {str(k): _coarsen(v, digits) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_coarsen(v, digits) for v in obj]
+    if isinstance(obj, bool) or obj is None or isinstance(obj, str):
+        return obj
+    if isinstance(obj, (int, float)):
+        if obj == 0 or not math.isfinite(obj):
+            return obj
+        return float(f"{obj:.{digits}g}")
+    return str(obj)
+
+
+def context_fingerprint(context, digits=2):
+    """Stable hash of an LLM context, insensitive to numeric changes below `digits` significant digits."""
+    payload = json.dumps(_coarsen(context, digits), sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def memo_lookup(memo, fingerprint):
+    """Return the memoized LLM result when `memo` was recorded for the same context fingerprint."""
+    if memo is not None and memo.get('fingerprint') == fingerprint and 'result' in memo:
+        return memo['result']
+    return None
+
+
+def memo_store(memo, fingerprint, result):
+    if memo is not None:
+        memo['fingerprint'] = fingerprint
+        memo['result'] = result
+
+
+# bytes at the start of the data file hashed to notice that it was rewritten rather than appended to
+HEAD_BYTES = 64 * 1024
+
+
+class SourceMismatchError(ValueError):
+    pass
+
+
+def _head_digest(f, n):
+    f.seek(0)
+    return hashlib.sha256(f.read(n)).hexdigest()
+
+
+class IncrementalState:
+    """
+    State persisted between incremental runs: the data file it tracks (path, byte offset and
+    row count after the last processed row, and a hash of the file's head), the highest IDENT
+    processed so far, the mergeable aggregates of every row seen (a StreamingProfile) and
+    memoized LLM results keyed by a fingerprint of the context they were generated from.
+    Assumes IDENT increases monotonically as records are appended.
+    """
+
+    def __init__(self, path, last_ident=None, profile=None, llm_memos=None, sample_size=100_000, source=None):
+        self.path = path
+        self.last_ident = last_ident
+        self.profile = profile or StreamingProfile(sample_size=sample_size)
+        self.llm_memos = llm_memos if llm_memos is not None else {'plot_plan': {}, 'insights': {}}
+        self.source = source
+
+    @classmethod
+    def load(cls, path, sample_size=100_000):
+        if not os.path.exists(path):
+            return cls(path, sample_size=sample_size)
+        with open(path, 'r') as f:
+            state = json.load(f)
+        return cls(path, state.get('last_ident'), StreamingProfile.from_dict(state['profile']), state.get('llm_memos'),
+                   source=state.get('source'))
+
+    def save(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'source': self.source, 'last_ident': self.last_ident, 'profile': self.profile.to_dict(),
+                       'llm_memos': self.llm_memos}, f)
+        os.replace(tmp_path, self.path)
+
+    def _resume_offset(self, f, size):
+        """Byte offset to continue parsing from, or 0 when the file shrank or its head changed."""
+        source = self.source or {}
+        offset = source.get('offset', 0)
+        if not offset or size < offset or _head_digest(f, min(offset, HEAD_BYTES)) != source.get('head'):
+            return 0
+        return offset
+
+    def fold_csv(self, path, chunksize=100_000, transform=None, ident_column='IDENT', **read_csv_kwargs):
+        """
+        Fold rows of `path` with IDENT above the last processed one into the profile; returns how many.
+        Parsing resumes at the byte offset where the previous run stopped, unless the file shrank or
+        its head changed, in which case the whole file is parsed and filtered on IDENT. Raises
+        SourceMismatchError when the state was built from another file.
+        """
+        real_path = os.path.realpath(path)
+        if self.source is not None and self.source.get('path') != real_path:
+            raise SourceMismatchError(f"{self.path} tracks {self.source.get('path')}, not {real_path}; "
+                                      "use a separate state file (--state) for each data file")
+        new_rows = 0
+        with open(real_path, 'rb') as f:
+            offset = self._resume_offset(f, os.fstat(f.fileno()).st_size)
+            rows = self.source['rows'] if offset else 0
+            if offset:
+                columns = pd.read_csv(real_path, nrows=0, **read_csv_kwargs).columns
+                f.seek(offset)
+                reader = pd.read_csv(f, chunksize=chunksize, header=None, names=columns, **read_csv_kwargs)
+            else:
+                f.seek(0)
+                reader = pd.read_csv(f, chunksize=chunksize, **read_csv_kwargs)
+            for chunk in reader:
+                rows += len(chunk)
+                if self.last_ident is not None:
+                    chunk = chunk[chunk[ident_column] > self.last_ident]
+                if chunk.empty:
+                    continue
+                self.profile.update(transform(chunk) if transform else chunk)
+                chunk_max = chunk[ident_column].max()
+                self.last_ident = chunk_max.item() if hasattr(chunk_max, 'item') else chunk_max
+                new_rows += len(chunk)
+            # the reader consumed the file to EOF, so this is where the next run picks up
+            end = f.tell()
+            self.source = {'path': real_path, 'offset': end, 'rows': rows, 'head': _head_digest(f, min(end, HEAD_BYTES)),
+                           'resumed_from': offset}
+        return new_rows
@@ -1,15 +1,19 @@
 from crewai import Agent
-import openai
 import os
 import yaml
-import json
 import numpy as np
 from ultrasafe_client.ultrasafe import UltraSafe
+from agents.context_packer import ContextPacker, compact_json, context_budget
+from agents.incremental import context_fingerprint, memo_lookup, memo_store
+from agents.tracing import traced
+
+MODEL = "usf1-mini"
 
 class InsightGenerationAgent(Agent):
-    def __init__(self, *args, prompt_dir=None, **kwargs):
+    def __init__(self, *args, prompt_dir=None, token_budget=None, **kwargs):
         super().__init__(*args, **kwargs)
         self._prompt_dir = prompt_dir or os.path.dirname(__file__)
+        self._token_budget = token_budget or context_budget(MODEL)
 
     def _to_json(self, obj):
         if isinstance(obj, dict):
@@ -24,15 +28,92 @@ class InsightGenerationAgent(Agent):
             return bool(obj)
         return obj
 
-    def _summarize_kb(self, entries, max_items=3):
+    def _summarize_kb(self, entries):
         summary = []
-        for entry in entries[:max_items]:
+        for entry in entries:
             lines = entry.splitlines()
             title = lines[0] if lines else ''
             summary.append({'title': title, 'content': entry})
         return summary
 
-    def generate_insights(self, exploration_summary, analysis_results, visualizations, relevant_methods=None, best_practices=None):
+    def _summarize_group_tests(self, group_tests):
+        # p-values only: the statistics themselves add tokens but nothing the report can act on
+        return {col: {'n_groups': tests['n_groups'], 'n_values': tests['n_values'],
+                      'p_values': {name: float(f"{tests[name]['p_value']:.3g}")
+                                   for name in ('levene', 'brown_forsythe', 'anova', 'kruskal')}}
+                for col, tests in group_tests.items()}
+
+    def _insight_context(self, exploration_summary, analysis_results, visualizations, relevant_methods, best_practices):
+        """Agent outputs packed by priority into the token budget (see agents/context_packer.py)."""
+        exploration_summary = self._to_json(exploration_summary)
+        analysis_results = self._to_json(analysis_results)
+        packer = ContextPacker(self._token_budget)
+        packer.add(('exploration_summary', 'unique_problem_count'), exploration_summary.get('unique_problem_count', 0), priority=10)
+        packer.add(('exploration_summary', 'quality_issues'), exploration_summary.get('quality_issues', []), priority=9)
+        packer.add(('analysis_results', 'top_issues_percentages'), analysis_results.get('top_issues_percentages', {}), priority=9, limit=20)
+        packer.add(('exploration_summary', 'most_common_problems'), exploration_summary.get('most_common_problems', {}), priority=8, limit=20)
+        packer.add(('analysis_results', 'assumption_checks'), analysis_results.get('assumption_checks', {}), priority=8)
+        if 'problem_clusters' in exploration_summary:
+            clusters = exploration_summary['problem_clusters']
+            packer.add(('exploration_summary', 'problem_clusters', 'cluster_count'), clusters['cluster_count'], priority=8)
+            packer.add(('exploration_summary', 'problem_clusters', 'rare_cluster_count'), len(clusters['rare_clusters']), priority=8)
+            packer.add(('exploration_summary', 'problem_clusters', 'most_common_clusters'), clusters['most_common_clusters'], priority=6)
+        packer.add(('analysis_results', 'suggestions'), analysis_results.get('suggestions', []), priority=7)
+        packer.add(('analysis_results', 'group_tests'), self._summarize_group_tests(analysis_results.get('group_tests', {})),
+                   priority=6, limit=10)
+        packer.add(('visualizations',), self._to_json(visualizations), priority=5)
+        packer.add(('exploration_summary', 'rare_problems'), exploration_summary.get('rare_problems', []), priority=4, limit=20)
+        packer.add(('relevant_methods',), self._summarize_kb(relevant_methods or []), priority=3, truncate=True)
+        packer.add(('best_practices',), self._summarize_kb(best_practices or []), priority=2, truncate=True)
+        context = packer.pack()
+        print(f"[InsightGenerationAgent] Packed context: {packer.tokens}/{packer.budget} tokens "
+              f"({packer.dropped} items left out).")
+        return context
+
+    def _build_insight_prompt(self, context):
+        prompt_path = os.path.join(self._prompt_dir, 'llm_insight_prompt.yaml')
+        try:
+            with open(prompt_path, 'r') as f:
+                prompt_template = yaml.safe_load(f)['prompt']
+        except Exception as e:
+            print(f"Prompt YAML error: {e}")
+            return None
+        prompt = prompt_template.format(context_json=compact_json(context))
+        
+        if not os.getenv("ULTRASAFE_API_KEY"):
+            raise ValueError("ULTRASAFE_API_KEY environment variable not set.")
+        return prompt
+
+    def _insight_request(self, prompt):
+        return dict(
+            model=MODEL,
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.2,
+            max_tokens=1800
+        )
+
+    def _memoized_report(self, context, report_memo, stream_to):
+        """Fingerprint of `context` and the report memoized for it in `report_memo` (None if it changed)."""
+        if report_memo is None:
+            return None, None
+        fingerprint = context_fingerprint(context)
+        report = memo_lookup(report_memo, fingerprint)
+        if report is not None:
+            print("[InsightGenerationAgent] Report context unchanged since last run; reusing the previous report.")
+            self._emit(stream_to, report)
+        return fingerprint, report
+
+    def _emit(self, stream_to, text):
+        if stream_to is not None:
+            stream_to.write(text)
+            stream_to.flush()
+        return text
+
+    @traced('insights.generate')
+    def generate_insights(self, exploration_summary, analysis_results, visualizations, relevant_methods=None, best_practices=None, stream_to=None, report_memo=None):
         """
         Use LLM to generate a comprehensive Markdown report from all agent outputs, with context reduction for large outputs.
         Args:
@@ -41,51 +122,60 @@ class InsightGenerationAgent(Agent):
             visualizations (list)
             relevant_methods (list)
             best_practices (list)
+            stream_to (file-like, optional): if given, the report is streamed from the API and
+                written to it chunk by chunk as it arrives
+            report_memo (dict, optional): memoizes the report across runs; it is reused without
+                calling the LLM while the reduced context is unchanged
         Returns:
             str: Markdown report
         """
-        context = {
-            'exploration_summary': {
-                'most_common_problems': dict(list(exploration_summary.get('most_common_problems', {}).items())[:5]),
-                'unique_problem_count': exploration_summary.get('unique_problem_count', 0),
-                'rare_problems': exploration_summary.get('rare_problems', [])[:5],
-                'quality_issues': exploration_summary.get('quality_issues', [])
-            },
-            'analysis_results': {
-                'top_issues_percentages': dict(list(analysis_results.get('top_issues_percentages', {}).items())[:5]),
-                'assumption_checks': analysis_results.get('assumption_checks', {}),
-                'suggestions': analysis_results.get('suggestions', [])[:3]
-            },
-            'visualizations': visualizations[:3],
-            'relevant_methods': self._summarize_kb(relevant_methods or [], max_items=3),
-            'best_practices': self._summarize_kb(best_practices or [], max_items=3)
-        }
-        serializable_context = self._to_json(context)
-        prompt_path = os.path.join(self._prompt_dir, 'llm_insight_prompt.yaml')
+        context = self._insight_context(exploration_summary, analysis_results, visualizations, relevant_methods, best_practices)
+        fingerprint, report = self._memoized_report(context, report_memo, stream_to)
+        if report is not None:
+            return report
+        prompt = self._build_insight_prompt(context)
+        if prompt is None:
+            return self._emit(stream_to, "Error: Could not load prompt.")
+        chunks = []
         try:
-            with open(prompt_path, 'r') as f:
-                prompt_template = yaml.safe_load(f)['prompt']
+            if stream_to is None:
+                response = UltraSafe.chat.Completions.create(**self._insight_request(prompt))
+                llm_content = response["choices"][0]["message"]["content"]
+                memo_store(report_memo, fingerprint, llm_content)
+                return llm_content
+            for delta in UltraSafe.chat.Completions.create(**self._insight_request(prompt), stream=True):
+                chunks.append(self._emit(stream_to, delta))
+            memo_store(report_memo, fingerprint, "".join(chunks))
+            return "".join(chunks)
         except Exception as e:
-            print(f"Prompt YAML error: {e}")
-            return "Error: Could not load prompt."
-        prompt = prompt_template.format(context_json=json.dumps(serializable_context, indent=2))
-        
-        if not os.getenv("ULTRASAFE_API_KEY"):
-            raise ValueError("ULTRASAFE_API_KEY environment variable not set.")
+            print(f"OpenAI API error: {e}")
+            chunks.append(self._emit(stream_to, ("\n\n" if chunks else "") + "Error: Could not generate LLM report."))
+            return "".join(chunks)
 
+    @traced('insights.generate')
+    async def agenerate_insights(self, exploration_summary, analysis_results, visualizations, relevant_methods=None, best_practices=None, stream_to=None, report_memo=None):
+        """
+        Async variant of generate_insights() using UltraSafe.chat.Completions.acreate.
+        """
+        context = self._insight_context(exploration_summary, analysis_results, visualizations, relevant_methods, best_practices)
+        fingerprint, report = self._memoized_report(context, report_memo, stream_to)
+        if report is not None:
+            return report
+        prompt = self._build_insight_prompt(context)
+        if prompt is None:
+            return self._emit(stream_to, "Error: Could not load prompt.")
+        chunks = []
         try:
-            response = UltraSafe.chat.Completions.create(
-                model="usf1-mini",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.2,
-                max_tokens=1800
-            )
-            llm_content = llm_content = response["choices"][0]["message"]["content"] 
-
-            return llm_content
+            if stream_to is None:
+                response = await UltraSafe.chat.Completions.acreate(**self._insight_request(prompt))
+                llm_content = response["choices"][0]["message"]["content"]
+                memo_store(report_memo, fingerprint, llm_content)
+                return llm_content
+            async for delta in await UltraSafe.chat.Completions.acreate(**self._insight_request(prompt), stream=True):
+                chunks.append(self._emit(stream_to, delta))
+            memo_store(report_memo, fingerprint, "".join(chunks))
+            return "".join(chunks)
         except Exception as e:
             print(f"OpenAI API error: {e}")
-            return "Error: Could not generate LLM report." 
\ No newline at end of file
+            chunks.append(self._emit(stream_to, ("\n\n" if chunks else "") + "Error: Could not generate LLM report."))
+            return "".join(chunks)
@@ -0,0 +1,225 @@
+import functools
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+# Validated LLM plot plans shared across runs and files. Plans are keyed by a fingerprint of the
+# dataset's schema and a coarse summary of its distribution (cardinality, missingness and size
+# buckets), so files with the same layout reuse a plan without calling the LLM. The fingerprint also
+# covers the planner (prompt template, model, PLAN_SCHEMA), so changing any of them starts afresh;
+# plans also expire after a TTL. The LLM is asked for JSON-mode output and its answer is checked
+# against PLAN_SCHEMA's rules instead of being recovered with regexes.
+
+PLAN_STORE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "plot_plans.sqlite")
+
+PLOT_TYPES = ('bar', 'pie', 'histogram', 'scatter', 'boxplot', 'heatmap')
+# number of columns each plot type takes
+PLOT_ARITY = {'bar': 1, 'pie': 1, 'histogram': 1, 'boxplot': 1, 'scatter': 2, 'heatmap': 1}
+MAX_PLOTS = 8
+
+# OpenAI-style JSON mode; the expected shape is spelled out in the prompt and checked against
+# PLAN_SCHEMA (with jsonschema) by validate_plan
+RESPONSE_FORMAT = {"type": "json_object"}
+PLAN_SCHEMA = {
+    "type": "object",
+    "required": ["plots"],
+    "additionalProperties": False,
+    "properties": {
+        "plots": {
+            "type": "array",
+            "maxItems": MAX_PLOTS,
+            "items": {
+                "type": "object",
+                "required": ["plot_type", "columns", "description"],
+                "additionalProperties": False,
+                "properties": {
+                    "plot_type": {"enum": list(PLOT_TYPES)},
+                    "columns": {"type": "array", "items": {"type": "string"}},
+                    "description": {"type": "string"},
+                    "rationale": {"type": "string"},
+                },
+                # column count per plot type; a heatmap only plots the missing-value matrix
+                "allOf": [
+                    {
+                        "if": {"required": ["plot_type"], "properties": {"plot_type": {"const": plot_type}}},
+                        "then": {"properties": {"columns": {"const": ["missing"]} if plot_type == 'heatmap'
+                                                else {"minItems": arity, "maxItems": arity}}},
+                    }
+                    for plot_type, arity in PLOT_ARITY.items()
+                ],
+            },
+        },
+    },
+}
+
+
+class PlanValidationError(ValueError):
+    pass
+
+
+def parse_plan(content, columns):
+    """Parse the LLM's JSON-mode answer and validate it; raises PlanValidationError."""
+    try:
+        plan = json.loads(content)
+    except (TypeError, ValueError) as e:
+        raise PlanValidationError(f"response is not JSON: {e}")
+    return validate_plan(plan, columns)
+
+
+@functools.lru_cache(maxsize=1)
+def _schema_validator():
+    # jsonschema is only imported once a plan is actually validated
+    from jsonschema import Draft202012Validator
+    Draft202012Validator.check_schema(PLAN_SCHEMA)
+    return Draft202012Validator(PLAN_SCHEMA)
+
+
+def validate_plan(plan, columns):
+    """
+    Check a {"plots": [...]} object against PLAN_SCHEMA (jsonschema) and the dataset's columns
+    and return its instruction list. A malformed envelope raises PlanValidationError; individual
+    instructions that fail the schema or name unknown columns are dropped with a message, and
+    instructions beyond MAX_PLOTS are ignored.
+    """
+    from jsonschema.exceptions import best_match
+    item_errors = {}
+    for error in _schema_validator().iter_errors(plan):
+        path = list(error.absolute_path)
+        if len(path) >= 2 and path[0] == 'plots':
+            item_errors.setdefault(path[1], []).append(error)
+        elif error.validator != 'maxItems':
+            raise PlanValidationError(f"plan does not match PLAN_SCHEMA: {error.message}")
+    known = set(columns)
+    valid = []
+    for idx, instr in enumerate(plan['plots'][:MAX_PLOTS]):
+        if idx in item_errors:
+            problem = best_match(item_errors[idx]).message
+        elif instr['plot_type'] != 'heatmap' and not set(instr['columns']) <= known:
+            problem = f"unknown columns {sorted(set(instr['columns']) - known)}"
+        else:
+            valid.append(instr)
+            continue
+        print(f"[plan_store] Dropping plot instruction {idx}: {problem}")
+    if not valid:
+        raise PlanValidationError("no valid plot instructions")
+    return valid
+
+
+def _bucket(n):
+    # order of magnitude, so e.g. 40 and 60 distinct values land together but 40 and 4000 do not
+    return int(math.log10(n)) if n > 0 else -1
+
+
+def _null_bucket(null_count, n_rows):
+    if null_count == 0:
+        return 'none'
+    share = null_count / max(n_rows, 1)
+    return 'rare' if share < 0.01 else 'some' if share < 0.1 else 'many'
+
+
+def plan_fingerprint(profile, prompt_template, model):
+    """
+    Hash of the schema (columns, numeric or not), bucketed cardinality, missingness and row count,
+    and the planner that produced the plan: prompt template, model, plan schema and response format.
+    """
+    summary = {
+        'planner': {'prompt': prompt_template, 'model': model, 'schema': PLAN_SCHEMA, 'response_format': RESPONSE_FORMAT},
+        'rows': _bucket(profile.n_rows),
+        'columns': [],
+    }
+    for col in profile.columns:
+        if col == 'IDENT':
+            continue
+        numeric = profile.is_numeric(col)
+        summary['columns'].append({
+            'name': col,
+            'numeric': numeric,
+            # exact distinct counts of numeric columns are not needed (and expensive on large frames)
+            'cardinality': None if numeric else _bucket(profile.cardinality(col)),
+            'nulls': _null_bucket(profile.null_count(col), profile.n_rows),
+        })
+    payload = json.dumps(summary, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class PlanStore:
+    """
+    Validated plot plans keyed by plan_fingerprint(), backed by SQLite so batch and server
+    workers share it. The connection is opened lazily per process. Plans expire after `ttl`
+    seconds; once more than `max_entries` are stored the least recently used ones are evicted.
+    """
+
+    def __init__(self, path=PLAN_STORE_PATH, ttl=7 * 24 * 3600, max_entries=256):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._pid = os.getpid()
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS plans ("
+                " fingerprint TEXT PRIMARY KEY,"
+                " plan TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS plans_accessed ON plans (accessed)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, fingerprint, columns):
+        """The stored plan for `fingerprint`, re-validated against `columns`; None on a miss."""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT plan, created FROM plans WHERE fingerprint = ?", (fingerprint,)).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM plans WHERE fingerprint = ?", (fingerprint,))
+                row = None
+            elif row is not None:
+                conn.execute("UPDATE plans SET accessed = ? WHERE fingerprint = ?", (now, fingerprint))
+            conn.commit()
+        if row is None:
+            self.misses += 1
+            return None
+        try:
+            plan = validate_plan({'plots': json.loads(row[0])}, columns)
+        except (PlanValidationError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return plan
+
+    def put(self, fingerprint, plan):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO plans (fingerprint, plan, created, accessed) VALUES (?, ?, ?, ?)",
+                (fingerprint, json.dumps(plan), now, now),
+            )
+            conn.execute("DELETE FROM plans WHERE created < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM plans WHERE fingerprint IN ("
+                " SELECT fingerprint FROM plans ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            conn.commit()
+
+    def stats(self):
+        with self._lock:
+            size = self._connection().execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "size": size, "max_entries": self.max_entries, "ttl": self.ttl}
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+# Reductions that turn raw columns into fixed-size plot data (bin counts, quantiles, block
+# averages, top-N tables), so render time and the size of the specs shipped to the render pool
+# stay bounded however many rows the frame has. Everything here is a linear pass over the data:
+# quantiles use selection rather than a full sort, and histograms are accumulated chunk by chunk.
+
+HIST_BINS = 20
+DENSITY_BINS = 100
+# up to this many points a scatter is drawn point by point; above it, as a 2-D binned density
+SCATTER_MAX_POINTS = 5000
+HEATMAP_MAX_ROWS = 200
+MAX_FLIERS = 200
+CHUNK_ROWS = 1_000_000
+
+
+def _float_values(series):
+    return series.to_numpy(dtype='float64', na_value=np.nan)
+
+
+def histogram(series, bins=HIST_BINS):
+    """(counts, edges) of the finite values of `series`, accumulated over row chunks."""
+    values = _float_values(series)
+    finite = np.isfinite(values)
+    if not finite.any():
+        return np.zeros(bins, dtype=np.int64), np.linspace(0.0, 1.0, bins + 1)
+    lo, hi = values[finite].min(), values[finite].max()
+    edges = np.histogram_bin_edges([lo, hi], bins=bins)
+    counts = np.zeros(bins, dtype=np.int64)
+    for start in range(0, len(values), CHUNK_ROWS):
+        chunk = values[start:start + CHUNK_ROWS]
+        counts += np.histogram(chunk[np.isfinite(chunk)], bins=edges)[0]
+    return counts, edges
+
+
+def box_stats(series, label=None, max_fliers=MAX_FLIERS, seed=0):
+    """Tukey boxplot statistics in the form Axes.bxp expects, with at most `max_fliers` outliers."""
+    values = _float_values(series)
+    values = values[np.isfinite(values)]
+    if not len(values):
+        raise ValueError("no numeric values to summarize")
+    q1, med, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    whislo = values[values >= q1 - 1.5 * iqr].min()
+    whishi = values[values <= q3 + 1.5 * iqr].max()
+    fliers = values[(values < whislo) | (values > whishi)]
+    if len(fliers) > max_fliers:
+        # keep the extremes so the axis range is right, and a random subset of the rest
+        extremes = np.unique([fliers.argmin(), fliers.argmax()])
+        rest = np.setdiff1d(np.arange(len(fliers)), extremes)
+        picked = np.random.default_rng(seed).choice(rest, max_fliers - len(extremes), replace=False)
+        fliers = fliers[np.concatenate([extremes, picked])]
+    return {'med': med, 'q1': q1, 'q3': q3, 'whislo': whislo, 'whishi': whishi,
+            'fliers': fliers, 'mean': values.mean(), 'label': label or ''}
+
+
+def scatter_or_density(x, y, max_points=SCATTER_MAX_POINTS, bins=DENSITY_BINS):
+    """Spec fields for a numeric x/y plot: raw points when few, otherwise a 2-D histogram."""
+    xv, yv = _float_values(x), _float_values(y)
+    both = np.isfinite(xv) & np.isfinite(yv)
+    xv, yv = xv[both], yv[both]
+    if len(xv) <= max_points:
+        return {'kind': 'scatter', 'x': xv, 'y': yv}
+    counts, xedges, yedges = np.histogram2d(xv, yv, bins=bins)
+    return {'kind': 'density', 'counts': counts, 'xedges': xedges, 'yedges': yedges, 'points': int(len(xv))}
+
+
+def missingness_blocks(profile, columns, max_rows=HEATMAP_MAX_ROWS):
+    """Fraction of missing values per column over at most `max_rows` contiguous row blocks."""
+    masks = {col: profile.null_mask(col).to_numpy(dtype=np.int64) for col in columns}
+    n = len(next(iter(masks.values()))) if masks else 0
+    if n == 0:
+        return pd.DataFrame(columns=columns, dtype=float)
+    starts = np.unique(np.linspace(0, n, min(n, max_rows) + 1).astype(np.int64)[:-1])
+    sizes = np.diff(np.append(starts, n))
+    return pd.DataFrame({col: np.add.reduceat(mask, starts) / sizes for col, mask in masks.items()},
+                        index=[str(s) for s in starts])
+
+
+def category_pair_counts(data, x, y, x_labels, y_labels):
+    """Co-occurrence counts of the given x and y labels (rows: y, columns: x)."""
+    pairs = data.loc[data[x].isin(x_labels) & data[y].isin(y_labels), [x, y]]
+    counts = pairs.groupby([y, x], observed=True).size()
+    return counts.unstack(fill_value=0).reindex(index=list(y_labels), columns=list(x_labels), fill_value=0)
@@ -0,0 +1,123 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Plots are described as plain dict "specs" (kind, path, title, data...) so they can be
+# rendered in worker processes with matplotlib's object-oriented API on the Agg backend,
+# without touching pyplot's global state.
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def _new_figure(figsize):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _draw(fig, spec):
+    kind = spec['kind']
+    ax = fig.add_subplot(111)
+    if kind == 'bar':
+        ax.bar([str(label) for label in spec['labels']], spec['values'], color=spec.get('color'))
+        ax.tick_params(axis='x', labelrotation=spec.get('rotation', 45))
+        for label in ax.get_xticklabels():
+            label.set_horizontalalignment('right')
+    elif kind == 'pie':
+        ax.pie(spec['values'], labels=[str(label) for label in spec['labels']], autopct='%1.1f%%', startangle=140)
+    elif kind == 'hist':
+        # pre-binned counts (see plot_aggregation.histogram), drawn as weighted bins
+        ax.hist(spec['edges'][:-1], bins=spec['edges'], weights=spec['counts'], color='lightgreen', edgecolor='black')
+    elif kind == 'box':
+        ax.bxp([spec['stats']], showmeans=False)
+    elif kind == 'scatter':
+        ax.scatter(spec['x'], spec['y'], alpha=0.5)
+    elif kind == 'density':
+        import numpy as np
+        from matplotlib.colors import LogNorm
+        counts = np.ma.masked_equal(spec['counts'].T, 0)
+        mesh = ax.pcolormesh(spec['xedges'], spec['yedges'], counts, norm=LogNorm(), cmap='viridis')
+        fig.colorbar(mesh, ax=ax, label=f"points per bin ({spec['points']} total)")
+    elif kind == 'heatmap':
+        import seaborn as sns
+        sns.heatmap(spec['matrix'], ax=ax, cbar=spec.get('cbar', False), annot=spec.get('annot', False),
+                    fmt=spec.get('fmt', '.2g'), cmap=spec.get('cmap'), vmin=spec.get('vmin'), vmax=spec.get('vmax'))
+    else:
+        raise ValueError(f"Unknown plot kind '{kind}'")
+    if spec.get('xlabel'):
+        ax.set_xlabel(spec['xlabel'])
+    if spec.get('ylabel'):
+        ax.set_ylabel(spec['ylabel'])
+    ax.set_title(spec.get('title', ''))
+
+
+def render_plot(spec):
+    """
+    Render one spec to spec['path']. Returns {'path', 'seconds', 'error'} plus the wall-clock
+    start, CPU seconds and pid of the rendering process (for tracing); errors are reported
+    rather than raised so one bad plot does not sink the batch.
+    """
+    started, start, cpu_start = time.time(), time.perf_counter(), time.process_time()
+    try:
+        fig = _new_figure(spec.get('figsize', (10, 6)))
+        _draw(fig, spec)
+        if spec.get('tight', True):
+            fig.tight_layout()
+        fig.savefig(spec['path'], metadata={'Software': None})
+        error = None
+    except Exception as e:
+        error = str(e)
+    return {'path': spec['path'], 'seconds': time.perf_counter() - start, 'error': error,
+            'started': started, 'cpu_s': time.process_time() - cpu_start, 'pid': os.getpid()}
+
+
+def _get_pool(max_workers):
+    """
+    The process pool shared by every render_plots() call, created on first use. Callers may be
+    worker threads (concurrent pipeline stages), so workers are started by a fork server (or
+    spawned) rather than forked from this possibly multi-threaded process.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != max_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(method))
+            _pool_workers = max_workers
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+
+
+def render_plots(specs, max_workers=None):
+    """
+    Render specs in the shared process pool (in order, one result per spec).
+    max_workers (default: one per core) sizes the pool; max_workers=1, or a single spec,
+    renders in-process. If the pool breaks (e.g. a worker was killed) the specs are rendered
+    in-process and a new pool is started on the next call.
+    """
+    if not specs:
+        return []
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_workers <= 1 or len(specs) == 1:
+        return [render_plot(spec) for spec in specs]
+    pool = _get_pool(max_workers)
+    try:
+        return list(pool.map(render_plot, specs))
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        return [render_plot(spec) for spec in specs]
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from agents import rag_retriever
+from agents.data_loading import normalize_text
+from agents.embedding_store import atomic_save, file_lock
+from agents.tracing import traced
+
+# Near-duplicate clustering of PROBLEM strings: unique strings are embedded in large batches
+# (embeddings cached on disk by string hash), linked to their nearest neighbours through a
+# FAISS index when cosine similarity clears a threshold, and the linked components become clusters.
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "problem_embeddings")
+
+SIMILARITY_THRESHOLD = 0.9
+NEIGHBOURS = 10
+EMBED_BATCH_SIZE = 4096
+SEARCH_BATCH_SIZE = 65536
+# below this many strings an exact (flat) index is as fast as building an HNSW graph
+ANN_MIN_SIZE = 20_000
+# sha1 hex digest plus newline: hashes.txt has fixed-width records, so row counts come from its size
+HASH_WIDTH = 41
+
+
+def _text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Append-only store of normalized embeddings keyed by string hash. New rows are appended to a raw
+    float32 file (embeddings.f32) and their hashes to a fixed-width hashes.txt, so adding a batch
+    writes only that batch; manifest.json records the model and dimension. Appends are serialized
+    across processes with a lock file, and rows appended by other processes are picked up.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, model_name=rag_retriever.MODEL_NAME):
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self._manifest_path = os.path.join(cache_dir, "manifest.json")
+        self._hash_path = os.path.join(cache_dir, "hashes.txt")
+        self._emb_path = os.path.join(cache_dir, "embeddings.f32")
+        self._lock_path = os.path.join(cache_dir, ".lock")
+        self._rows = {}
+        self._n = 0
+        self._dim = None
+        self._embs = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self._manifest_path, "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        if manifest.get("model") != self.model_name:
+            return
+        self._dim = manifest["dim"]
+        try:
+            self._read_rows(self._rows_on_disk())
+        except (OSError, ValueError):
+            self._rows, self._n, self._embs = {}, 0, None
+
+    def _rows_on_disk(self):
+        """Rows present in both files; a writer that died between the two appends leaves extra bytes in one."""
+        try:
+            return min(os.path.getsize(self._emb_path) // (self._dim * 4), os.path.getsize(self._hash_path) // HASH_WIDTH)
+        except OSError:
+            return 0
+
+    def _read_rows(self, n):
+        """Read the hashes of rows [self._n, n) and map the first n embedding rows."""
+        start = self._n
+        new_rows = {}
+        if n > start:
+            with open(self._hash_path, "rb") as f:
+                f.seek(start * HASH_WIDTH)
+                lines = f.read((n - start) * HASH_WIDTH).decode("ascii").split("\n")
+            new_rows = {h: start + i for i, h in enumerate(lines[:n - start])}
+        self._embs = np.memmap(self._emb_path, dtype="float32", mode="r", shape=(n, self._dim)) if n else None
+        self._rows.update(new_rows)
+        self._n = n
+
+    @traced('clustering.embed', 'clustering')
+    def embed(self, texts, batch_size=EMBED_BATCH_SIZE):
+        """Return an (n, d) float32 matrix of unit-norm embeddings for `texts`, encoding only unseen ones."""
+        hashes = [_text_hash(t) for t in texts]
+        missing = list({h: t for h, t in zip(hashes, texts) if h not in self._rows}.items())
+        if missing:
+            model = rag_retriever._get_model()
+            new_embs = np.vstack([
+                model.encode([t for _, t in missing[start:start + batch_size]], batch_size=256, convert_to_numpy=True)
+                for start in range(0, len(missing), batch_size)
+            ]).astype("float32")
+            new_embs /= np.maximum(np.linalg.norm(new_embs, axis=1, keepdims=True), 1e-12)
+            self._append([h for h, _ in missing], new_embs)
+        print(f"[problem_clustering] Embedded {len(missing)} of {len(texts)} unique problem strings.")
+        return np.asarray(self._embs[[self._rows[h] for h in hashes]], dtype="float32")
+
+    def _append(self, hashes, embs):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with file_lock(self._lock_path):
+                if self._dim is None:
+                    # another process may have created the store since we looked
+                    self._load()
+                if self._dim is None:
+                    # no store yet, or one built with another model: start a new one
+                    self._dim = embs.shape[1]
+                    for path in (self._emb_path, self._hash_path):
+                        open(path, "wb").close()
+                    atomic_save(self._manifest_path, self._save_manifest)
+                n = self._rows_on_disk()
+                if n < self._n:
+                    # the store was reset underneath us
+                    self._rows, self._n = {}, 0
+                # truncating drops the tail of an append that did not complete in both files
+                with open(self._emb_path, "ab") as f:
+                    f.truncate(n * self._dim * 4)
+                    f.write(np.ascontiguousarray(embs, dtype="float32").tobytes())
+                with open(self._hash_path, "ab") as f:
+                    f.truncate(n * HASH_WIDTH)
+                    f.write("".join(h + "\n" for h in hashes).encode("ascii"))
+                # also picks up rows other processes appended since we last looked
+                self._read_rows(n + len(hashes))
+        except OSError as e:
+            print(f"[problem_clustering] Could not persist embedding cache: {e}")
+            self._embs = embs if self._embs is None else np.vstack([np.asarray(self._embs[:self._n]), embs])
+            self._rows.update({h: self._n + i for i, h in enumerate(hashes)})
+            self._n += len(hashes)
+
+    def _save_manifest(self, path):
+        with open(path, "w") as f:
+            json.dump({"model": self.model_name, "dim": self._dim}, f)
+
+
+def _build_ann_index(embs):
+    import faiss
+    if len(embs) < ANN_MIN_SIZE:
+        index = faiss.IndexFlatIP(embs.shape[1])
+    else:
+        index = faiss.IndexHNSWFlat(embs.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = 64
+        index.hnsw.efSearch = 64
+    index.add(embs)
+    return index
+
+
+@traced('clustering.neighbours', 'clustering')
+def _neighbour_components(embs, threshold, neighbours):
+    """Label connected components of the graph linking each vector to its neighbours above `threshold`."""
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    n = len(embs)
+    index = _build_ann_index(embs)
+    k = min(neighbours + 1, n)
+    rows, cols = [], []
+    for start in range(0, n, SEARCH_BATCH_SIZE):
+        sims, idx = index.search(embs[start:start + SEARCH_BATCH_SIZE], k)
+        linked = (sims >= threshold) & (idx >= 0)
+        rows.append(np.nonzero(linked)[0] + start)
+        cols.append(idx[linked])
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    graph = coo_matrix((np.ones(len(rows), dtype=bool), (rows, cols)), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+    return labels
+
+
+def cluster_problems(counts, threshold=SIMILARITY_THRESHOLD, neighbours=NEIGHBOURS, cache=None):
+    """
+    Group near-duplicate problem strings.
+    Args:
+        counts (pd.Series): value counts indexed by problem string (e.g. profile.value_counts('PROBLEM'))
+        threshold (float): cosine similarity above which two strings are linked
+        neighbours (int): nearest neighbours looked up per string
+        cache (EmbeddingCache, optional): embedding store to use (default: the on-disk cache)
+    Returns:
+        dict: 'labels' maps each original string to its cluster's representative (its most frequent
+        member), 'counts' holds cluster-level frequencies (most frequent first) and 'sizes' the
+        number of distinct strings per cluster.
+    """
+    counts = counts[counts > 0]
+    if len(counts) == 0:
+        empty = pd.Series(dtype='int64')
+        return {'labels': pd.Series(dtype=object), 'counts': empty, 'sizes': empty}
+    # exact variants (case, whitespace, trailing punctuation) collapse before any embedding
+    normalized = normalize_text(pd.Series(counts.index.astype(str), dtype=object))
+    norm_codes, norm_texts = pd.factorize(normalized)
+    embs = (cache or EmbeddingCache()).embed(list(norm_texts))
+    components = _neighbour_components(embs, threshold, neighbours)[norm_codes]
+
+    members = pd.DataFrame({'problem': np.asarray(counts.index, dtype=object), 'count': counts.to_numpy(), 'cluster': components})
+    members = members.sort_values('count', ascending=False, kind='stable')
+    representatives = members.groupby('cluster', sort=False)['problem'].first()
+    cluster_counts = members.groupby('cluster', sort=False)['count'].sum()
+    cluster_sizes = members.groupby('cluster', sort=False)['problem'].size()
+    cluster_counts.index = representatives[cluster_counts.index].to_numpy()
+    cluster_sizes.index = representatives[cluster_sizes.index].to_numpy()
+    labels = pd.Series(representatives[members['cluster']].to_numpy(), index=members['problem'].to_numpy())
+    return {
+        'labels': labels,
+        'counts': cluster_counts.sort_values(ascending=False, kind='stable'),
+        'sizes': cluster_sizes,
+    }
@@ -1,16 +1,349 @@
-from crewai import Agent
-import faiss, numpy as np
-from sentence_transformers import SentenceTransformer
-
-# build simple RAG KB at startup
-model = SentenceTransformer("all-MiniLM-L6-v2")
-with open("knowledge_base/stats_best_practices.txt") as f:
-    docs = [l.strip() for l in f if l.strip()]
-embs = model.encode(docs, convert_to_numpy=True)
-index = faiss.IndexFlatIP(embs.shape[1])
-index.add(embs)
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+import numpy as np
+from agents.embedding_store import atomic_save, save_embeddings
+from agents.tracing import traced
+
+# Unified knowledge base index: every .md/.txt file under knowledge_base/ is split into chunks at
+# its Markdown headings and held in memory with a BM25 inverted index and (optionally) dense
+# sentence-transformer vectors; queries rank chunks by reciprocal-rank fusion of both. File mtimes
+# are checked on each lookup and only changed files are re-chunked / re-embedded. Chunk embeddings
+# persist under <kb_dir>/.rag_cache keyed by content hash; sentence_transformers is only
+# imported once an embedding is actually needed.
+MODEL_NAME = "all-MiniLM-L6-v2"
+KB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "knowledge_base")
+KB_EXTENSIONS = (".md", ".txt")
+
+QUERY_CACHE_SIZE = 1024
+BM25_K1 = 1.5
+BM25_B = 0.75
+# reciprocal-rank fusion constant: score = sum over rankers of 1 / (RRF_K + rank)
+RRF_K = 60
+
+_model = None
+_kb = None
+_kb_lock = threading.Lock()
+_model_lock = threading.Lock()
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _get_model():
+    """Load the SentenceTransformer on first use; a warm index never needs it."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            from sentence_transformers import SentenceTransformer
+            _model = SentenceTransformer(MODEL_NAME)
+    return _model
+
+
+def _text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+
+def _cache_paths(cache_dir):
+    return (
+        os.path.join(cache_dir, "manifest.json"),
+        os.path.join(cache_dir, "embeddings.npy"),
+    )
+
+
+def _load_manifest(manifest_path):
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("model") != MODEL_NAME:
+        return None
+    return manifest
+
+
+def _save_manifest(path, hashes):
+    with open(path, "w") as f:
+        json.dump({"model": MODEL_NAME, "hashes": hashes}, f)
+
+
+def chunk_document(name, text):
+    """
+    Split a document at its Markdown headings. Each chunk keeps its raw text (so the chunks of a
+    file concatenate back to the file) and, for retrieval, its heading trail plus body.
+    """
+    chunks, trail, lines = [], [], []
+
+    def close():
+        raw = "".join(lines)
+        body = "\n".join(l.strip() for l in lines[1 if heading else 0:] if l.strip())
+        title = " > ".join(t for _, t in trail) if heading else ""
+        content = f"{title}\n{body}" if title else body
+        chunks.append({"file": name, "title": title, "text": raw, "content": content,
+                       "indexed": bool(body), "hash": _text_hash(content)})
+
+    heading = None
+    for line in text.splitlines(keepends=True):
+        match = _HEADING.match(line)
+        if match:
+            if lines:
+                close()
+            level = len(match.group(1))
+            trail = [(l, t) for l, t in trail if l < level] + [(level, match.group(2))]
+            heading, lines = line, [line]
+        else:
+            lines.append(line)
+    if lines:
+        close()
+    return chunks
+
+
+class KnowledgeBaseIndex:
+    """
+    Heading-level chunks of the knowledge base with a BM25 inverted index and dense vectors.
+    refresh() picks up added, edited and deleted files; search() ranks chunks for a query.
+    Chunk vectors persist in `cache_dir` (default: <kb_dir>/.rag_cache). A rebuild publishes the
+    chunks, postings and vectors together, so a search racing a refresh sees either index whole.
+    """
+
+    def __init__(self, kb_dir=KB_DIR, dense=True, extensions=KB_EXTENSIONS, cache_dir=None):
+        self.kb_dir = kb_dir
+        self.dense = dense
+        self.extensions = extensions
+        self.cache_dir = cache_dir or os.path.join(kb_dir, ".rag_cache")
+        self.version = 0
+        self._files = {}  # name -> {"signature": (mtime_ns, size), "chunks": [...]}
+        self._chunks = []
+        self._postings = {}
+        self._lengths = np.zeros(0)
+        self._vectors = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _scan(self):
+        try:
+            entries = [e for e in os.scandir(self.kb_dir) if e.is_file() and e.name.endswith(self.extensions)]
+        except OSError as e:
+            print(f"[rag_retriever] Could not read knowledge base directory: {e}")
+            return {}
+        return {e.name: (e.stat().st_mtime_ns, e.stat().st_size) for e in entries}
+
+    def refresh(self):
+        """Re-chunk files whose mtime/size changed since the last call; returns True if anything changed."""
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self):
+        signatures = self._scan()
+        changed = [name for name, sig in signatures.items()
+                   if self._files.get(name, {}).get("signature") != sig]
+        removed = [name for name in self._files if name not in signatures]
+        if not changed and not removed:
+            return False
+        for name in removed:
+            del self._files[name]
+        for name in changed:
+            try:
+                with open(os.path.join(self.kb_dir, name), "r") as f:
+                    text = f.read()
+            except OSError as e:
+                print(f"[rag_retriever] Could not read {name}: {e}")
+                continue
+            self._files[name] = {"signature": signatures[name], "chunks": chunk_document(name, text)}
+        self._rebuild()
+        print(f"[rag_retriever] Indexed {len(self._chunks)} chunks from {len(self._files)} knowledge base "
+              f"files ({len(changed)} changed, {len(removed)} removed).")
+        return True
+
+    @traced('rag.build_index', 'rag')
+    def _rebuild(self):
+        chunks = [c for name in sorted(self._files) for c in self._files[name]["chunks"] if c["indexed"]]
+        postings = {}
+        lengths = np.zeros(len(chunks))
+        for i, chunk in enumerate(chunks):
+            terms = _tokenize(chunk["content"])
+            lengths[i] = len(terms)
+            for term, tf in Counter(terms).items():
+                postings.setdefault(term, []).append((i, tf))
+        vectors = self._embed([c["hash"] for c in chunks], [c["content"] for c in chunks]) if self.dense else None
+        with self._lock:
+            self._chunks, self._postings, self._lengths, self._vectors = chunks, postings, lengths, vectors
+            self.version += 1
+
+    def _snapshot(self):
+        with self._lock:
+            return self._chunks, self._postings, self._lengths, self._vectors
+
+    def _embed(self, hashes, texts):
+        """
+        Unit-norm vectors for the chunks, reusing the on-disk store and encoding only new chunk text.
+        When no chunk changed, the store's memory-mapped array is returned without copying it.
+        """
+        if not texts:
+            return None
+        manifest_path, emb_path = _cache_paths(self.cache_dir)
+        manifest = _load_manifest(manifest_path)
+        cached_rows, cached_embs = {}, None
+        if manifest and os.path.exists(emb_path):
+            try:
+                cached_embs = np.load(emb_path, mmap_mode="r")
+                if len(cached_embs) == len(manifest.get("hashes", [])):
+                    cached_rows = {h: i for i, h in enumerate(manifest["hashes"])}
+            except (OSError, ValueError):
+                cached_embs = None
+        missing = sorted({h: t for h, t in zip(hashes, texts) if h not in cached_rows}.items())
+        if not missing and manifest.get("hashes") == hashes:
+            # the store holds exactly these chunks in this order: search the memory-mapped file as is
+            return cached_embs
+        new_rows = {}
+        if missing:
+            new_embs = _get_model().encode([t for _, t in missing], convert_to_numpy=True).astype("float32")
+            new_embs /= np.maximum(np.linalg.norm(new_embs, axis=1, keepdims=True), 1e-12)
+            new_rows = {h: new_embs[i] for i, (h, _) in enumerate(missing)}
+            print(f"[rag_retriever] Re-embedded {len(missing)} of {len(texts)} knowledge base chunks.")
+        embs = np.vstack([new_rows[h] if h in new_rows else cached_embs[cached_rows[h]] for h in hashes]).astype("float32")
+        if missing or manifest is None or manifest.get("hashes") != hashes:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                atomic_save(emb_path, save_embeddings, embs)
+                atomic_save(manifest_path, _save_manifest, hashes)
+            except OSError as e:
+                print(f"[rag_retriever] Could not persist embedding cache: {e}")
+        return embs
+
+    @staticmethod
+    def _bm25(query, n, all_postings, lengths):
+        scores = np.zeros(n)
+        if not n:
+            return scores
+        avg_length = lengths.mean() or 1.0
+        for term in set(_tokenize(query)):
+            postings = all_postings.get(term)
+            if not postings:
+                continue
+            idf = np.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, tf in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[i] / avg_length)
+                scores[i] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, k=3, vector=None):
+        """
+        Top-k chunks for `query` as dicts (file, title, content, score). `vector` is the query's
+        embedding; without one (or with dense=False) ranking is BM25 only.
+        """
+        chunks, postings, lengths, vectors = self._snapshot()
+        fused = np.zeros(len(chunks))
+        bm25 = self._bm25(query, len(chunks), postings, lengths)
+        matched = np.flatnonzero(bm25)
+        fused[matched[np.argsort(-bm25[matched])]] += 1.0 / (RRF_K + 1 + np.arange(len(matched)))
+        if vector is not None and vectors is not None:
+            sims = vectors @ (vector / max(np.linalg.norm(vector), 1e-12))
+            fused[np.argsort(-sims)] += 1.0 / (RRF_K + 1 + np.arange(len(sims)))
+        top = [i for i in np.argsort(-fused, kind="stable")[:k] if fused[i] > 0]
+        return [{"file": chunks[i]["file"], "title": chunks[i]["title"],
+                 "content": chunks[i]["content"], "score": float(fused[i])} for i in top]
+
+    def document(self, name):
+        """Full text of a knowledge base file, reassembled from its cached chunks."""
+        return "".join(c["text"] for c in self._files[name]["chunks"])
+
+
+def get_kb():
+    """The shared KnowledgeBaseIndex, refreshed against the files' mtimes."""
+    global _kb
+    with _kb_lock:
+        if _kb is None:
+            _kb = KnowledgeBaseIndex()
+        _kb.refresh()
+    return _kb
+
+
+def document(name):
+    return get_kb().document(name)
+
+
+class _LRUCache:
+    """Small thread-safe LRU map with hit/miss counters."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize}
+
+
+_vector_cache = _LRUCache(QUERY_CACHE_SIZE)
+_result_cache = _LRUCache(QUERY_CACHE_SIZE)
+
+
+def cache_info():
+    return {"vectors": _vector_cache.info(), "results": _result_cache.info()}
+
+
+def clear_cache():
+    _vector_cache.clear()
+    _result_cache.clear()
+
+
+@traced('rag.retrieve', 'rag')
+def retrieve_many(queries, k: int = 3):
+    """
+    Retrieve the top-k knowledge base chunks (heading trail + text) for each query.
+    Uncached queries are encoded in one batch; results are cached until the KB changes.
+    """
+    kb = get_kb()
+    results = [_result_cache.get((kb.version, q, k)) for q in queries]
+    pending = list(dict.fromkeys(q for q, r in zip(queries, results) if r is None))
+    if pending:
+        vecs = [None] * len(pending)
+        if kb.dense:
+            vecs = [_vector_cache.get(q) for q in pending]
+            to_encode = [q for q, v in zip(pending, vecs) if v is None]
+            if to_encode:
+                encoded = _get_model().encode(to_encode, convert_to_numpy=True).astype("float32")
+                for q, v in zip(to_encode, encoded):
+                    _vector_cache.put(q, v)
+                new_vecs = dict(zip(to_encode, encoded))
+                vecs = [new_vecs[q] if v is None else v for q, v in zip(pending, vecs)]
+        found = {}
+        for q, vec in zip(pending, vecs):
+            found[q] = [hit["content"] for hit in kb.search(q, k, vector=vec)]
+            _result_cache.put((kb.version, q, k), found[q])
+        results = [found[q] if r is None else r for q, r in zip(queries, results)]
+    return [list(r) for r in results]
+
 
 def retrieve(query: str, k: int = 3):
-    vec = model.encode([query], convert_to_numpy=True)
-    sims, idx = index.search(vec, k)
-    return [docs[i] for i in idx[0]]
+    return retrieve_many([query], k)[0]
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+# Cold-start import profiling via `python -X importtime`, run in a fresh interpreter so modules
+# already imported by the caller do not hide their cost.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The agent modules main.py builds its pipeline from
+AGENT_MODULES = (
+    'agents.data_exploration_agent',
+    'agents.statistical_analysis_agent',
+    'agents.visualization_agent',
+    'agents.insight_generation_agent',
+    'agents.rag_retriever',
+)
+
+# Allowed median cold import time of AGENT_MODULES in seconds (benchmarks/startup_budget.py, tests/)
+STARTUP_BUDGET = float(os.getenv("STARTUP_BUDGET", 1.5))
+
+
+def profile_imports(modules=('main',), python=sys.executable, cwd=ROOT):
+    """
+    Import `modules` in a fresh interpreter with -X importtime.
+    Returns (records, wall_seconds); each record is {'module', 'depth', 'self_us', 'cumulative_us'}.
+    """
+    code = "import time; _t = time.perf_counter()\n"
+    code += "".join(f"import {module}\n" for module in modules)
+    code += "print(time.perf_counter() - _t)"
+    proc = subprocess.run([python, '-X', 'importtime', '-c', code], cwd=cwd,
+                          capture_output=True, text=True, env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1'))
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {', '.join(modules)} failed:\n{proc.stderr.strip()[-2000:]}")
+    records = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        records.append({
+            'module': name.strip(),
+            'depth': (len(name) - len(name.lstrip()) - 1) // 2,
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us),
+        })
+    return records, float(proc.stdout.strip().splitlines()[-1])
+
+
+def package_totals(records):
+    """Self import time summed per top-level package, slowest first."""
+    totals = {}
+    for r in records:
+        package = r['module'].split('.')[0]
+        totals[package] = totals.get(package, 0) + r['self_us']
+    return sorted(totals.items(), key=lambda kv: kv[1], reverse=True)
+
+
+def format_report(records, wall_seconds, top=20):
+    lines = [f"Cold import wall time: {wall_seconds:.3f}s ({len(records)} modules)", "",
+             f"{'package':<32}{'self total (ms)':>16}"]
+    lines += [f"{package:<32}{us / 1000:>16.1f}" for package, us in package_totals(records)[:top]]
+    lines += ["", f"{'module':<48}{'self (ms)':>12}{'cumulative (ms)':>18}"]
+    slowest = sorted(records, key=lambda r: r['cumulative_us'], reverse=True)[:top]
+    lines += [f"{'  ' * r['depth'] + r['module']:<48}{r['self_us'] / 1000:>12.1f}{r['cumulative_us'] / 1000:>18.1f}"
+              for r in slowest]
+    return "\n".join(lines)
@@ -1,20 +1,23 @@
 from crewai import Agent
-import pandas as pd
-from scipy.stats import shapiro, levene
+from agents.group_stats import group_codes, group_tests
+from agents.dataset_profile import DatasetProfile
+from agents.tracing import traced
 
 class StatisticalAnalysisAgent(Agent):
-    def analyze(self, data, exploration_summary):
+    @traced('statistics.analyze')
+    def analyze(self, data, exploration_summary, profile=None):
         """
         Analyze the dataset, calculate problem frequencies, and check statistical assumptions.
         """
+        profile = profile or DatasetProfile(data)
         results = {}
-        problem_counts = data['PROBLEM'].value_counts()
-        total = len(data)
+        problem_counts = profile.value_counts('PROBLEM')
+        total = profile.n_rows
         problem_percentages = (problem_counts / total * 100).round(2).to_dict()
         top_issues = dict(list(problem_percentages.items())[:5])
         results['top_issues_percentages'] = top_issues
         results['all_issue_percentages'] = problem_percentages
-        numeric_cols = data.select_dtypes(include='number').columns
+        numeric_cols = profile.numeric_columns
         assumption_checks = {}
         suggestions = []
         if len(numeric_cols) > 0:
@@ -25,6 +28,7 @@ class StatisticalAnalysisAgent(Agent):
             if len(col_data) > 5000:
                 col_data = col_data.sample(n=5000, random_state=42)
 
+            from scipy.stats import shapiro
             stat, p = shapiro(col_data)
             assumption_checks['normality'] = p > 0.05
 
@@ -32,13 +36,22 @@ class StatisticalAnalysisAgent(Agent):
                 suggestions.append(
                     'Normality assumption violated for t-test. Consider non-parametric alternatives (e.g., Mann-Whitney U test).'
             )
-            if 'PROBLEM' in data.columns and data['PROBLEM'].nunique() > 1:
-                groups = [g[1][col].dropna() for g in data.groupby('PROBLEM') if len(g[1][col].dropna()) > 1]
-                if len(groups) > 1:
-                    stat, p = levene(*groups)
-                    assumption_checks['homoscedasticity'] = p > 0.05
-                    if p <= 0.05:
-                        suggestions.append('Equal variance assumption violated for ANOVA/t-test. Consider Welch’s test or non-parametric alternatives.')
+        # Levene/Brown-Forsythe, ANOVA and Kruskal-Wallis across PROBLEM groups for every numeric column
+        group_results = {}
+        if numeric_cols and 'PROBLEM' in profile.columns and profile.cardinality('PROBLEM') > 1:
+            # PROBLEM is factorized once and its codes shared by every column's tests
+            codes = group_codes(data['PROBLEM'])
+            for col in numeric_cols:
+                tests = group_tests(data[col], codes)
+                if tests is not None:
+                    group_results[col] = tests
+        if len(numeric_cols) > 0 and numeric_cols[0] in group_results:
+            # scipy's levene() default is median-centred, i.e. Brown-Forsythe
+            p = group_results[numeric_cols[0]]['brown_forsythe']['p_value']
+            assumption_checks['homoscedasticity'] = p > 0.05
+            if p <= 0.05:
+                suggestions.append('Equal variance assumption violated for ANOVA/t-test. Consider Welch’s test or non-parametric alternatives.')
+        results['group_tests'] = group_results
         results['assumption_checks'] = assumption_checks
         results['suggestions'] = suggestions
         return results 
\ No newline at end of file
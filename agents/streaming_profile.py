@@ -0,0 +1,293 @@
+import numpy as np
+import pandas as pd
+from agents.data_loading import value_counts
+
+# Mergeable accumulators for chunked CSV ingestion. Each one folds in a DataFrame chunk at a
+# time with bounded memory (apart from exact value counts, which grow with cardinality) and
+# can be merged with another accumulator of the same kind built over a different slice.
+
+
+class ValueCounter:
+    """Exact value counts; ties keep first-seen order (also for categorical chunks, see data_loading.value_counts)."""
+
+    def __init__(self):
+        self.counts = pd.Series(dtype='int64')
+
+    def update(self, values):
+        self._add(value_counts(values, sort=False))
+
+    def merge(self, other):
+        self._add(other.counts)
+
+    def _add(self, counts):
+        if len(self.counts) == 0:
+            self.counts = counts.astype('int64')
+        elif len(counts):
+            self.counts = pd.concat([self.counts, counts]).groupby(level=0, sort=False).sum()
+
+    def value_counts(self):
+        return self.counts.sort_values(ascending=False, kind='stable')
+
+    def to_dict(self):
+        return {'values': self.counts.index.tolist(), 'counts': self.counts.astype('int64').tolist()}
+
+    @classmethod
+    def from_dict(cls, state):
+        counter = cls()
+        counter.counts = pd.Series(state['counts'], index=state['values'], dtype='int64')
+        return counter
+
+
+class NumericMoments:
+    """Count, mean, variance (Welford/Chan), min and max of a numeric column."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def update(self, values):
+        values = values.dropna().to_numpy(dtype='float64')
+        if len(values) == 0:
+            return
+        other = NumericMoments()
+        other.count = len(values)
+        other.mean = float(values.mean())
+        other.m2 = float(((values - other.mean) ** 2).sum())
+        other.min = float(values.min())
+        other.max = float(values.max())
+        self.merge(other)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2, self.min, self.max = other.count, other.mean, other.m2, other.min, other.max
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def std(self):
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else None
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2, 'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, state):
+        moments = cls()
+        moments.count, moments.mean, moments.m2, moments.min, moments.max = (
+            state['count'], state['mean'], state['m2'], state['min'], state['max'])
+        return moments
+
+
+class ReservoirSample:
+    """Uniform random sample of up to `size` rows (Algorithm R, vectorized per chunk)."""
+
+    def __init__(self, size, seed=42):
+        self.size = size
+        self.seen = 0
+        self.frame = None
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, chunk):
+        chunk = chunk.reset_index(drop=True)
+        if self.frame is None:
+            self.frame = chunk.iloc[:0].copy()
+        fill = max(0, min(self.size - len(self.frame), len(chunk)))
+        if fill:
+            self.frame = pd.concat([self.frame, chunk.iloc[:fill]], ignore_index=True)
+        rest = np.arange(fill, len(chunk))
+        if len(rest):
+            # row t (0-based, over the whole stream) replaces a random slot with probability size / (t + 1)
+            slots = self._rng.integers(0, self.seen + rest + 1)
+            keep = slots < self.size
+            # when several rows hit the same slot, the last one wins
+            replace = pd.Series(rest[keep], index=slots[keep]).groupby(level=0).last()
+            if len(replace):
+                incoming = chunk.iloc[replace.to_numpy()].set_axis(replace.index)
+                self.frame = pd.concat([self.frame.drop(index=replace.index), incoming]).sort_index()
+        self.seen += len(chunk)
+
+    def merge(self, other):
+        if other.frame is None or other.seen == 0:
+            return
+        if self.frame is None or self.seen == 0:
+            self.frame, self.seen = other.frame.copy(), other.seen
+            return
+        k = min(self.size, len(self.frame) + len(other.frame))
+        from_self = self._rng.hypergeometric(self.seen, other.seen, k)
+        from_self = min(max(from_self, k - len(other.frame)), len(self.frame))
+        self.frame = pd.concat([
+            self.frame.sample(n=from_self, random_state=self._rng.integers(2 ** 32)),
+            other.frame.sample(n=k - from_self, random_state=self._rng.integers(2 ** 32)),
+        ], ignore_index=True)
+        self.seen += other.seen
+
+    def to_dict(self):
+        frame = self.frame if self.frame is not None else pd.DataFrame()
+        return {
+            'size': self.size,
+            'seen': self.seen,
+            'columns': list(frame.columns),
+            'rows': frame.astype(object).where(frame.notnull(), None).values.tolist(),
+            'rng': self._rng.bit_generator.state,
+        }
+
+    @classmethod
+    def from_dict(cls, state, dtypes=None):
+        sample = cls(state['size'])
+        sample.seen = state['seen']
+        sample._rng.bit_generator.state = state['rng']
+        if state['columns']:
+            frame = pd.DataFrame(state['rows'], columns=state['columns'])
+            for col, dtype in (dtypes or {}).items():
+                if col in frame.columns:
+                    try:
+                        frame[col] = frame[col].astype(dtype)
+                    except (TypeError, ValueError):
+                        pass
+            sample.frame = frame
+        return sample
+
+
+class StreamingProfile:
+    """
+    DatasetProfile-compatible summary built from CSV chunks with bounded memory.
+    Value counts of text columns, null counts and numeric moments are exact; row-level
+    statistics (quantiles, Shapiro/Levene inputs, plots) come from a reservoir sample
+    exposed as `data`.
+    """
+
+    def __init__(self, sample_size=100_000, seed=42):
+        self.n_rows = 0
+        self.columns = []
+        self.dtypes = {}
+        self._numeric = set()
+        self._value_counters = {}
+        self._null_counts = {}
+        self._moments = {}
+        self._sample = ReservoirSample(sample_size, seed)
+
+    @classmethod
+    def from_csv(cls, path, chunksize=100_000, sample_size=100_000, seed=42, transform=None, **read_csv_kwargs):
+        """Build a profile from `path` chunk by chunk; `transform` (optional) is applied to each chunk first."""
+        profile = cls(sample_size=sample_size, seed=seed)
+        for chunk in pd.read_csv(path, chunksize=chunksize, **read_csv_kwargs):
+            profile.update(transform(chunk) if transform else chunk)
+        return profile
+
+    def update(self, chunk):
+        if not self.columns:
+            self.columns = list(chunk.columns)
+            self.dtypes = {col: str(dtype) for col, dtype in chunk.dtypes.items()}
+            self._numeric = {col for col in self.columns if pd.api.types.is_numeric_dtype(chunk[col])}
+        chunk = chunk[self.columns].copy()
+        for col in self.columns:
+            if col in self._numeric:
+                if not pd.api.types.is_numeric_dtype(chunk[col]):
+                    chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+                self._moments.setdefault(col, NumericMoments()).update(chunk[col])
+            else:
+                self._value_counters.setdefault(col, ValueCounter()).update(chunk[col])
+            self._null_counts[col] = self._null_counts.get(col, 0) + int(chunk[col].isnull().sum())
+        self._sample.update(chunk)
+        self.n_rows += len(chunk)
+
+    def merge(self, other):
+        if not self.columns:
+            self.columns, self.dtypes, self._numeric = list(other.columns), dict(other.dtypes), set(other._numeric)
+        for col, counter in other._value_counters.items():
+            self._value_counters.setdefault(col, ValueCounter()).merge(counter)
+        for col, moments in other._moments.items():
+            self._moments.setdefault(col, NumericMoments()).merge(moments)
+        for col, count in other._null_counts.items():
+            self._null_counts[col] = self._null_counts.get(col, 0) + count
+        self._sample.merge(other._sample)
+        self.n_rows += other.n_rows
+
+    def to_dict(self):
+        """JSON-serializable snapshot of every accumulator, for resuming in a later run."""
+        return {
+            'n_rows': self.n_rows,
+            'columns': self.columns,
+            'dtypes': self.dtypes,
+            'numeric': sorted(self._numeric),
+            'value_counts': {col: c.to_dict() for col, c in self._value_counters.items()},
+            'null_counts': self._null_counts,
+            'moments': {col: m.to_dict() for col, m in self._moments.items()},
+            'sample': self._sample.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        profile = cls()
+        profile.n_rows = state['n_rows']
+        profile.columns = state['columns']
+        profile.dtypes = state['dtypes']
+        profile._numeric = set(state['numeric'])
+        profile._value_counters = {col: ValueCounter.from_dict(c) for col, c in state['value_counts'].items()}
+        profile._null_counts = state['null_counts']
+        profile._moments = {col: NumericMoments.from_dict(m) for col, m in state['moments'].items()}
+        profile._sample = ReservoirSample.from_dict(state['sample'], profile.dtypes)
+        return profile
+
+    @property
+    def data(self):
+        """Reservoir sample of rows, for statistics that need row-level data."""
+        if self._sample.frame is None:
+            return pd.DataFrame(columns=self.columns)
+        return self._sample.frame
+
+    def value_counts(self, column):
+        if column in self._value_counters:
+            return self._value_counters[column].value_counts()
+        # numeric columns are not counted exactly (IDENT-like columns would grow without bound)
+        return self.data[column].value_counts()
+
+    def null_mask(self, column):
+        return self.data[column].isnull()
+
+    def null_count(self, column):
+        return self._null_counts.get(column, 0)
+
+    def has_nulls(self, column):
+        return self.null_count(column) > 0
+
+    def null_matrix(self):
+        return self.data[self.columns].isnull()
+
+    def cardinality(self, column):
+        return len(self.value_counts(column))
+
+    def is_numeric(self, column):
+        return column in self._numeric
+
+    @property
+    def numeric_columns(self):
+        return [col for col in self.columns if col in self._numeric]
+
+    def top_counts(self, column, n):
+        counts = self.value_counts(column)
+        return counts[:n], counts[n:].sum()
+
+    def numeric_summary(self, column):
+        moments = self._moments.get(column, NumericMoments())
+        values = self.data[column].dropna()
+        quantiles = values.quantile([0.25, 0.5, 0.75]) if len(values) else pd.Series(dtype=float)
+        return {
+            'count': moments.count,
+            'mean': moments.mean if moments.count else None,
+            'std': moments.std,
+            'min': moments.min,
+            'max': moments.max,
+            'quantiles': {float(q): float(v) for q, v in quantiles.items()},
+        }
@@ -0,0 +1,151 @@
+import contextlib
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+
+# Lightweight span instrumentation for the pipeline. Tracing is off unless enable() is called;
+# while off, span() and @traced cost a single global lookup. Spans record wall time, thread CPU
+# time and the growth of the process's peak RSS, plus any attributes the caller sets (e.g. token
+# counts), and export as Chrome trace events (load the JSON in chrome://tracing or Perfetto).
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+_tracer = None
+
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class _NoopSpan:
+    def set(self, **attrs):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    def __init__(self, name, category, attrs):
+        self.name = name
+        self.category = category
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """Attach attributes (token counts, sizes, ...) to the span."""
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    """Collects completed spans as Chrome trace 'complete' (ph='X') events."""
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def record(self, name, category, start, seconds, pid=None, tid=None, **attrs):
+        """Add a span that was timed elsewhere; `start` is a time.time() timestamp."""
+        event = {
+            'name': name, 'cat': category, 'ph': 'X',
+            'ts': int(start * 1e6), 'dur': int(seconds * 1e6),
+            'pid': pid or os.getpid(), 'tid': tid or threading.get_ident(),
+            'args': attrs,
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self):
+        """Per span name: call count, total/max wall seconds and total CPU seconds."""
+        totals = {}
+        with self._lock:
+            events = list(self.events)
+        for e in events:
+            t = totals.setdefault(e['name'], {'count': 0, 'wall_s': 0.0, 'max_s': 0.0, 'cpu_s': 0.0})
+            t['count'] += 1
+            t['wall_s'] += e['dur'] / 1e6
+            t['max_s'] = max(t['max_s'], e['dur'] / 1e6)
+            t['cpu_s'] += e['args'].get('cpu_s', 0.0)
+        return totals
+
+    def export(self, path):
+        with self._lock:
+            events = sorted(self.events, key=lambda e: e['ts'])
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return path
+
+
+def enable():
+    """Start collecting spans into a fresh Tracer (also hooks the UltraSafe client) and return it."""
+    global _tracer
+    from ultrasafe_client.ultrasafe import UltraSafe
+    _tracer = Tracer()
+    UltraSafe.chat.Completions.trace_span = span
+    return _tracer
+
+
+def disable():
+    """Stop tracing; returns the Tracer that was active (or None)."""
+    global _tracer
+    from ultrasafe_client.ultrasafe import UltraSafe
+    tracer, _tracer = _tracer, None
+    UltraSafe.chat.Completions.trace_span = None
+    return tracer
+
+
+def active():
+    return _tracer
+
+
+@contextlib.contextmanager
+def span(name, category='pipeline', **attrs):
+    """Time the enclosed block as a span; yields an object whose set() attaches attributes."""
+    tracer = _tracer
+    if tracer is None:
+        yield _NOOP_SPAN
+        return
+    current = Span(name, category, attrs)
+    start, wall0, cpu0, rss0 = time.time(), time.perf_counter(), time.thread_time(), _peak_rss_kb()
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        current.attrs['cpu_s'] = round(time.thread_time() - cpu0, 6)
+        if rss0 is not None:
+            current.attrs['peak_rss_delta_kb'] = _peak_rss_kb() - rss0
+        tracer.record(name, category, start, time.perf_counter() - wall0, **current.attrs)
+
+
+def traced(name=None, category='agent'):
+    """Decorator form of span() for plain and async functions/methods."""
+    def decorate(func):
+        label = name or func.__qualname__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if _tracer is None:
+                    return await func(*args, **kwargs)
+                with span(label, category):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with span(label, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
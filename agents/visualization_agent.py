@@ -1,16 +1,28 @@
 from crewai import Agent
-import matplotlib.pyplot as plt
-import pandas as pd
+import asyncio
 import os
-import openai
-import json
 import yaml
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from ultrasafe_client.ultrasafe import UltraSafe
+from agents.plot_rendering import render_plots
+from agents import plot_aggregation
+from agents.dataset_profile import DatasetProfile
+from agents.incremental import context_fingerprint, memo_lookup, memo_store
+from agents.context_packer import ContextPacker, compact_json, context_budget
+from agents.plan_store import RESPONSE_FORMAT, PlanValidationError, parse_plan, plan_fingerprint
+from agents import tracing
+
+MODEL = "usf1-mini"
+
 class VisualizationAgent(Agent):
-    def __init__(self, *args, prompt_dir=None, **kwargs):
+    def __init__(self, *args, prompt_dir=None, render_workers=None, token_budget=None, plan_store=None, **kwargs):
         super().__init__(*args, **kwargs)
         self._prompt_dir = prompt_dir or os.path.dirname(__file__)
+        self._render_workers = render_workers
+        self._token_budget = token_budget or context_budget(MODEL)
+        # optional agents.plan_store.PlanStore shared across files with the same schema
+        self._plan_store = plan_store
 
     def _to_json(self, obj):
         if isinstance(obj, dict):
@@ -26,91 +38,228 @@ class VisualizationAgent(Agent):
         return obj
 
     def _reduce_context(self, summary):
+        """Pack the dataset summary by priority into the token budget (see agents/context_packer.py)."""
+        exploration = summary.get('exploration_summary') or {}
+        analysis = summary.get('analysis_results') or {}
+        packer = ContextPacker(self._token_budget)
+        packer.add(('columns',), summary['columns'], priority=10)
+        packer.add(('dtypes',), summary['dtypes'], priority=10)
+        packer.add(('exploration_summary', 'unique_problem_count'), exploration.get('unique_problem_count', 0), priority=8)
+        packer.add(('exploration_summary', 'quality_issues'), exploration.get('quality_issues', []), priority=8)
+        packer.add(('sample_values',), summary['sample_values'], priority=7)
+        packer.add(('exploration_summary', 'most_common_problems'), exploration.get('most_common_problems', {}), priority=6, limit=10)
+        packer.add(('analysis_results', 'top_issues_percentages'), analysis.get('top_issues_percentages', {}), priority=6, limit=10)
+        packer.add(('analysis_results', 'assumption_checks'), analysis.get('assumption_checks', {}), priority=5)
+        packer.add(('analysis_results', 'suggestions'), analysis.get('suggestions', []), priority=4)
+        packer.add(('exploration_summary', 'rare_problems'), exploration.get('rare_problems', []), priority=2, limit=10)
+        context = packer.pack()
+        print(f"[VisualizationAgent] Packed context: {packer.tokens}/{packer.budget} tokens "
+              f"({packer.dropped} items left out).")
+        return context
+
+    def _top_problems_spec(self, profile, output_dir, N=5):
+        counts = profile.value_counts('PROBLEM')
+        top_counts = counts.head(N) / counts.sum() * 100
         return {
-            'columns': summary['columns'][:5],
-            'dtypes': {k: v for k, v in list(summary['dtypes'].items())[:5]},
-            'sample_values': {k: v for k, v in list(summary['sample_values'].items())[:5]},
-            'exploration_summary': {
-                'most_common_problems': dict(list(summary.get('exploration_summary', {}).get('most_common_problems', {}).items())[:3]),
-                'unique_problem_count': summary.get('exploration_summary', {}).get('unique_problem_count', 0),
-                'rare_problems': summary.get('exploration_summary', {}).get('rare_problems', [])[:3],
-                'quality_issues': summary.get('exploration_summary', {}).get('quality_issues', [])[:2]
-            },
-            'analysis_results': {
-                'top_issues_percentages': dict(list(summary.get('analysis_results', {}).get('top_issues_percentages', {}).items())[:3]),
-                'assumption_checks': summary.get('analysis_results', {}).get('assumption_checks', {}),
-                'suggestions': summary.get('analysis_results', {}).get('suggestions', [])[:2]
-            }
+            'kind': 'bar', 'label': f'Top {N} problems plot',
+            'path': os.path.join(output_dir, f'top_{N}_problems.png'),
+            'labels': list(top_counts.index), 'values': list(top_counts.values), 'color': 'skyblue',
+            'rotation': 30, 'figsize': (12, 6),
+            'xlabel': 'Problem', 'ylabel': 'Percentage of Occurrences', 'title': f'Top {N} Most Common Problems'
         }
 
-    def _plot_top_problems(self, data, output_dir, N=5):
-        counts = data['PROBLEM'].value_counts(normalize=True) * 100
-        top_counts = counts.head(N)
-        plt.figure(figsize=(12,6))
-        plt.bar(top_counts.index, top_counts.values, color='skyblue')
-        plt.ylabel('Percentage of Occurrences')
-        plt.xlabel('Problem')
-        plt.title(f'Top {N} Most Common Problems')
-        plt.xticks(rotation=30, ha='right')
-        plt.tight_layout()
-        fpath = os.path.join(output_dir, f'top_{N}_problems.png')
-        plt.savefig(fpath)
-        plt.close()
-        print(f"[VisualizationAgent] Top {N} problems plot saved: {fpath}")
-        return fpath
-
-    def visualize(self, data, analysis_results, exploration_summary=None):
-        output_dir = 'visualizations'
-        os.makedirs(output_dir, exist_ok=True)
+    def _render(self, specs):
+        """Render specs in the process pool, logging per-plot render time; returns the saved paths."""
         file_paths = []
-        # Always generate the top 5 problems plot
-        top_problems_path = self._plot_top_problems(data, output_dir, N=5)
-        file_paths.append(top_problems_path)
+        for spec, result in zip(specs, render_plots(specs, self._render_workers)):
+            tracer = tracing.active()
+            if tracer is not None:
+                tracer.record('visualization.render', 'plot', result['started'], result['seconds'], pid=result['pid'],
+                              tid=result['pid'], plot=spec['label'], cpu_s=result['cpu_s'], error=result['error'])
+            if result['error']:
+                print(f"[VisualizationAgent] Error generating plot {spec.get('title')}: {result['error']}")
+                continue
+            print(f"[VisualizationAgent] {spec['label']} saved: {result['path']} ({result['seconds']:.2f}s)")
+            file_paths.append(result['path'])
+        return file_paths
+
+    def _plot_context(self, data, profile, analysis_results, exploration_summary):
         summary = {
-            'columns': [col for col in data.columns if col != 'IDENT'],
-            'dtypes': {col: str(dtype) for col, dtype in data.dtypes.items() if col != 'IDENT'},
+            'columns': [col for col in profile.columns if col != 'IDENT'],
+            'dtypes': {col: dtype for col, dtype in profile.dtypes.items() if col != 'IDENT'},
             'sample_values': {col: vals for col, vals in data.head(3).to_dict().items() if col != 'IDENT'},
             'exploration_summary': exploration_summary,
             'analysis_results': analysis_results
         }
-        reduced = self._reduce_context(summary)
-        serializable = self._to_json(reduced)
+        return self._reduce_context(self._to_json(summary))
+
+    def _prompt_template(self):
         prompt_path = os.path.join(self._prompt_dir, 'llm_viz_prompt.yaml')
         try:
             with open(prompt_path, 'r') as f:
-                prompt_template = yaml.safe_load(f)['prompt']
+                return yaml.safe_load(f)['prompt']
         except Exception as e:
             print(f"Prompt YAML error: {e}")
-            return file_paths
-        prompt = prompt_template.format(dataset_summary=json.dumps(serializable, indent=2))
+            return None
+
+    def _build_plot_prompt(self, context):
+        prompt_template = self._prompt_template()
+        if prompt_template is None:
+            return None
+        prompt = prompt_template.format(dataset_summary=compact_json(context))
         if not os.getenv("ULTRASAFE_API_KEY"):
             raise ValueError("ULTRASAFE_API_KEY environment variable not set.")
+        return prompt
+
+    def _plan_request(self, prompt):
+        return dict(
+            model=MODEL,
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.2,
+            max_tokens=1200,
+            response_format=RESPONSE_FORMAT
+        )
 
+    def _parse_plot_instructions(self, response, profile):
+        """Validated plot instructions from the JSON-mode response (see agents/plan_store.py), or None."""
         try:
-            response = UltraSafe.chat.Completions.create(
-                model="usf1-mini",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.2,
-                max_tokens=1200
-            )
-            llm_content = llm_content = response["choices"][0]["message"]["content"]  
+            return parse_plan(response["choices"][0]["message"]["content"], profile.columns)
+        except PlanValidationError as e:
+            print(f"[VisualizationAgent] Rejected LLM plot plan: {e}")
+            return None
 
-            try:
-                plot_instructions = json.loads(llm_content)
-            except Exception:
-                import re
-                match = re.search(r'\[.*\]', llm_content, re.DOTALL)
-                if match:
-                    plot_instructions = json.loads(match.group(0))
-                else:
-                    print("Could not parse LLM output as JSON.")
-                    return file_paths
+    def _stored_plan(self, profile):
+        """Fingerprint of `profile`'s schema (and the planner) and the plan stored for it (None on a miss)."""
+        prompt_template = self._prompt_template() if self._plan_store is not None else None
+        if prompt_template is None:
+            return None, None
+        fingerprint = plan_fingerprint(profile, prompt_template, MODEL)
+        plan = self._plan_store.get(fingerprint, profile.columns)
+        if plan is not None:
+            print(f"[VisualizationAgent] Reusing the stored plot plan for schema {fingerprint[:12]}.")
+        return fingerprint, plan
+
+    def _store_plan(self, plan, plan_memo, context_key, schema_key):
+        memo_store(plan_memo, context_key, plan)
+        if self._plan_store is not None:
+            self._plan_store.put(schema_key, plan)
+
+    def _memoized_plan(self, context, plan_memo):
+        """Fingerprint of `context` and the plan memoized for it in `plan_memo` (None if it changed)."""
+        if plan_memo is None:
+            return None, None
+        fingerprint = context_fingerprint(context)
+        plan = memo_lookup(plan_memo, fingerprint)
+        if plan is not None:
+            print("[VisualizationAgent] Plot context unchanged since last run; reusing the previous plot plan.")
+        return fingerprint, plan
+
+    @tracing.traced('visualization.plan')
+    def _plan_plots(self, data, profile, analysis_results, exploration_summary, plan_memo=None):
+        schema_key, plan = self._stored_plan(profile)
+        if plan is not None:
+            return plan
+        context = self._plot_context(data, profile, analysis_results, exploration_summary)
+        fingerprint, plan = self._memoized_plan(context, plan_memo)
+        if plan is not None:
+            return plan
+        prompt = self._build_plot_prompt(context)
+        if prompt is None:
+            return None
+        try:
+            response = UltraSafe.chat.Completions.create(**self._plan_request(prompt))
+            plan = self._parse_plot_instructions(response, profile)
+        except Exception as e:
+            print(f"OpenAI API error: {e}")
+            return None
+        if plan:
+            self._store_plan(plan, plan_memo, fingerprint, schema_key)
+        return plan
+
+    @tracing.traced('visualization.plan')
+    async def _aplan_plots(self, data, profile, analysis_results, exploration_summary, plan_memo=None):
+        schema_key, plan = self._stored_plan(profile)
+        if plan is not None:
+            return plan
+        context = self._plot_context(data, profile, analysis_results, exploration_summary)
+        fingerprint, plan = self._memoized_plan(context, plan_memo)
+        if plan is not None:
+            return plan
+        prompt = self._build_plot_prompt(context)
+        if prompt is None:
+            return None
+        try:
+            response = await UltraSafe.chat.Completions.acreate(**self._plan_request(prompt))
+            plan = self._parse_plot_instructions(response, profile)
         except Exception as e:
             print(f"OpenAI API error: {e}")
-            return file_paths
+            return None
+        if plan:
+            self._store_plan(plan, plan_memo, fingerprint, schema_key)
+        return plan
+
+    @tracing.traced('visualization.visualize')
+    def visualize(self, data, analysis_results, exploration_summary=None, profile=None, plan_memo=None,
+                  output_dir='visualizations'):
+        """
+        Render the top problems plot plus the plots suggested by the LLM into `output_dir`. `plan_memo`
+        (optional dict) memoizes the LLM plot plan across runs: it is reused while the reduced context is unchanged.
+        The plan store (if configured) is checked first; on a miss the top problems plot renders while the LLM plans.
+        """
+        profile = profile or DatasetProfile(data)
+        os.makedirs(output_dir, exist_ok=True)
+        # Always generate the top 5 problems plot
+        top_spec = self._top_problems_spec(profile, output_dir, N=5)
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            top_problems = pool.submit(self._render, [top_spec])
+            plot_instructions = self._plan_plots(data, profile, analysis_results, exploration_summary, plan_memo)
+            file_paths = top_problems.result()
+        if plot_instructions:
+            file_paths += self._render(self._suggested_plot_specs(data, profile, plot_instructions, output_dir))
+        print(f"[VisualizationAgent] Final list of generated visualizations: {file_paths}")
+        return file_paths
+
+    @tracing.traced('visualization.visualize')
+    async def avisualize(self, data, analysis_results, exploration_summary=None, profile=None, plan_memo=None,
+                         output_dir='visualizations'):
+        """
+        Async variant of visualize(): the top problems plot renders while the LLM plans the rest.
+        """
+        profile = profile or DatasetProfile(data)
+        os.makedirs(output_dir, exist_ok=True)
+        top_spec = self._top_problems_spec(profile, output_dir, N=5)
+        top_problems = asyncio.ensure_future(asyncio.to_thread(self._render, [top_spec]))
+        plot_instructions = await self._aplan_plots(data, profile, analysis_results, exploration_summary, plan_memo)
+        file_paths = await top_problems
+        if plot_instructions:
+            specs = self._suggested_plot_specs(data, profile, plot_instructions, output_dir)
+            file_paths += await asyncio.to_thread(self._render, specs)
+        print(f"[VisualizationAgent] Final list of generated visualizations: {file_paths}")
+        return file_paths
+
+    def _categorical_bar_spec(self, profile, column, N=10, top_n=None):
+        # top-N + "Other" is computed once per column and shared by bar, pie and fallback plots
+        if top_n is not None and (column, N) in top_n:
+            return dict(top_n[(column, N)])
+        top_counts, other_count = profile.top_counts(column, N)
+        labels = list(top_counts.index) + (["Other"] if other_count > 0 else [])
+        values = list(top_counts.values) + ([other_count] if other_count > 0 else [])
+        spec = {'kind': 'bar', 'labels': labels, 'values': values, 'xlabel': column, 'ylabel': 'Count'}
+        if top_n is not None:
+            top_n[(column, N)] = spec
+        return dict(spec)
+
+    def _suggested_plot_specs(self, data, profile, plot_instructions, output_dir):
+        """
+        Turn plot instructions into render specs. Raw rows never reach matplotlib: every plot is
+        built from pre-aggregated data (see agents/plot_aggregation.py), so rendering cost does not
+        depend on the row count.
+        """
+        specs = []
+        top_n = {}
         for idx, instr in enumerate(plot_instructions):
             plot_type = instr.get('plot_type')
             columns = instr.get('columns', [])
@@ -124,129 +273,49 @@ class VisualizationAgent(Agent):
             try:
                 N = 10
                 if plot_type == 'bar' and len(columns) == 1:
-                    counts = data[columns[0]].value_counts()
-                    top_counts = counts[:N]
-                    other_count = counts[N:].sum()
-                    labels = list(top_counts.index) + (["Other"] if other_count > 0 else [])
-                    values = list(top_counts.values) + ([other_count] if other_count > 0 else [])
-                    plt.figure(figsize=(10,6))
-                    plt.bar(labels, values)
-                    plt.xlabel(columns[0])
-                    plt.ylabel('Count')
-                    plt.title(desc)
-                    plt.xticks(rotation=45, ha='right')
-                    plt.tight_layout()
-                    plt.savefig(fpath)
-                    plt.close()
-                    print(f"[VisualizationAgent] Bar plot saved: {fpath}")
+                    spec = dict(self._categorical_bar_spec(profile, columns[0], N, top_n), title=desc, label='Bar plot')
                 elif plot_type == 'pie' and len(columns) == 1:
-                    counts = data[columns[0]].value_counts()
-                    top_counts = counts[:N]
-                    other_count = counts[N:].sum()
-                    labels = list(top_counts.index) + (["Other"] if other_count > 0 else [])
-                    values = list(top_counts.values) + ([other_count] if other_count > 0 else [])
-                    plt.figure(figsize=(8,8))
-                    plt.pie(values, labels=labels, autopct='%1.1f%%', startangle=140)
-                    plt.title(desc)
-                    plt.savefig(fpath)
-                    plt.close()
-                    print(f"[VisualizationAgent] Pie chart saved: {fpath}")
+                    bar = self._categorical_bar_spec(profile, columns[0], N, top_n)
+                    spec = {'kind': 'pie', 'labels': bar['labels'], 'values': bar['values'], 'title': desc,
+                            'figsize': (8, 8), 'tight': False, 'label': 'Pie chart'}
                 elif plot_type == 'histogram' and len(columns) == 1:
-                    if pd.api.types.is_numeric_dtype(data[columns[0]]):
-                        plt.figure(figsize=(8,6))
-                        plt.hist(data[columns[0]].dropna(), bins=20, color='lightgreen', edgecolor='black')
-                        plt.xlabel(columns[0])
-                        plt.ylabel('Frequency')
-                        plt.title(desc)
-                        plt.tight_layout()
-                        plt.savefig(fpath)
-                        plt.close()
-                        print(f"[VisualizationAgent] Histogram saved: {fpath}")
+                    if profile.is_numeric(columns[0]):
+                        counts, edges = plot_aggregation.histogram(data[columns[0]])
+                        spec = {'kind': 'hist', 'counts': counts, 'edges': edges,
+                                'xlabel': columns[0], 'ylabel': 'Frequency', 'title': desc,
+                                'figsize': (8, 6), 'label': 'Histogram'}
                     else:
-                        counts = data[columns[0]].value_counts()
-                        top_counts = counts[:N]
-                        other_count = counts[N:].sum()
-                        labels = list(top_counts.index) + (["Other"] if other_count > 0 else [])
-                        values = list(top_counts.values) + ([other_count] if other_count > 0 else [])
-                        plt.figure(figsize=(10,6))
-                        plt.bar(labels, values)
-                        plt.xlabel(columns[0])
-                        plt.ylabel('Count')
-                        plt.title(desc + " (Top 10)")
-                        plt.xticks(rotation=45, ha='right')
-                        plt.tight_layout()
-                        plt.savefig(fpath)
-                        plt.close()
-                        print(f"[VisualizationAgent] Histogram (categorical as bar) saved: {fpath}")
+                        spec = dict(self._categorical_bar_spec(profile, columns[0], N, top_n), title=desc + " (Top 10)",
+                                    label='Histogram (categorical as bar)')
                 elif plot_type == 'boxplot' and len(columns) == 1:
-                    if pd.api.types.is_numeric_dtype(data[columns[0]]):
-                        plt.figure(figsize=(6,6))
-                        plt.boxplot(data[columns[0]].dropna())
-                        plt.ylabel(columns[0])
-                        plt.title(desc)
-                        plt.tight_layout()
-                        plt.savefig(fpath)
-                        plt.close()
-                        print(f"[VisualizationAgent] Boxplot saved: {fpath}")
+                    if profile.is_numeric(columns[0]):
+                        spec = {'kind': 'box', 'stats': plot_aggregation.box_stats(data[columns[0]], columns[0]),
+                                'ylabel': columns[0], 'title': desc, 'figsize': (6, 6), 'label': 'Boxplot'}
                     else:
-                        counts = data[columns[0]].value_counts()
-                        top_counts = counts[:N]
-                        other_count = counts[N:].sum()
-                        labels = list(top_counts.index) + (["Other"] if other_count > 0 else [])
-                        values = list(top_counts.values) + ([other_count] if other_count > 0 else [])
-                        plt.figure(figsize=(10,6))
-                        plt.bar(labels, values)
-                        plt.xlabel(columns[0])
-                        plt.ylabel('Count')
-                        plt.title(desc + " (Top 10)")
-                        plt.xticks(rotation=45, ha='right')
-                        plt.tight_layout()
-                        plt.savefig(fpath)
-                        plt.close()
-                        print(f"[VisualizationAgent] Boxplot (categorical as bar) saved: {fpath}")
+                        spec = dict(self._categorical_bar_spec(profile, columns[0], N, top_n), title=desc + " (Top 10)",
+                                    label='Boxplot (categorical as bar)')
                 elif plot_type == 'scatter' and len(columns) == 2:
                     x, y = columns[0], columns[1]
-                    if 'IDENT' in [x, y]:
-                        print(f"[VisualizationAgent] Skipping scatter plot with IDENT column.")
-                        continue
-                    if pd.api.types.is_numeric_dtype(data[x]) and pd.api.types.is_numeric_dtype(data[y]):
-                        plt.figure(figsize=(8,6))
-                        plt.scatter(data[x], data[y], alpha=0.5)
-                        plt.xlabel(x)
-                        plt.ylabel(y)
-                        plt.title(desc)
-                        plt.tight_layout()
-                        plt.savefig(fpath)
-                        plt.close()
-                        print(f"[VisualizationAgent] Scatter plot saved: {fpath}")
+                    if profile.is_numeric(x) and profile.is_numeric(y):
+                        spec = dict(plot_aggregation.scatter_or_density(data[x], data[y]),
+                                    xlabel=x, ylabel=y, title=desc, figsize=(8, 6), label='Scatter plot')
                     else:
-                        x_counts = data[x].value_counts()[:N].index
-                        y_counts = data[y].value_counts()[:N].index
-                        filtered = data[data[x].isin(x_counts) & data[y].isin(y_counts)]
-                        plt.figure(figsize=(10,6))
-                        plt.scatter(filtered[x], filtered[y], alpha=0.5)
-                        plt.xlabel(x)
-                        plt.ylabel(y)
-                        plt.title(desc + " (Top 10)")
-                        plt.tight_layout()
-                        plt.savefig(fpath)
-                        plt.close()
-                        print(f"[VisualizationAgent] Scatter plot (categorical filtered) saved: {fpath}")
+                        # co-occurrence counts of the top categories instead of overplotted points
+                        matrix = plot_aggregation.category_pair_counts(
+                            data, x, y, profile.value_counts(x)[:N].index, profile.value_counts(y)[:N].index)
+                        spec = {'kind': 'heatmap', 'matrix': matrix, 'annot': True, 'fmt': 'd', 'cbar': True,
+                                'cmap': 'Blues', 'xlabel': x, 'ylabel': y, 'title': desc + " (Top 10)",
+                                'figsize': (12, 9), 'label': 'Scatter plot (categorical counts)'}
                 elif plot_type == 'heatmap' and columns == ['missing']:
-                    import seaborn as sns
-                    plt.figure(figsize=(10,6))
-                    sns.heatmap(data.isnull(), cbar=False)
-                    plt.title(desc)
-                    plt.tight_layout()
-                    plt.savefig(fpath)
-                    plt.close()
-                    print(f"[VisualizationAgent] Heatmap saved: {fpath}")
+                    spec = {'kind': 'heatmap', 'matrix': plot_aggregation.missingness_blocks(profile, profile.columns),
+                            'cbar': True, 'vmin': 0.0, 'vmax': 1.0, 'ylabel': 'First row of block',
+                            'title': desc + " (fraction missing)", 'label': 'Heatmap'}
                 else:
                     print(f"[VisualizationAgent] Plot type '{plot_type}' with columns {columns} not supported. Skipping.")
                     continue
-                file_paths.append(fpath)
+                spec['path'] = fpath
+                specs.append(spec)
             except Exception as e:
                 print(f"[VisualizationAgent] Error generating plot {desc}: {e}")
                 continue
-        print(f"[VisualizationAgent] Final list of generated visualizations: {file_paths}")
-        return file_paths 
\ No newline at end of file
+        return specs
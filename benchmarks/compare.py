@@ -0,0 +1,59 @@
+"""
+Compare two pipeline_benchmark.py result files stage by stage (median seconds per row count).
+
+    python benchmarks/compare.py benchmarks/results/<base>.json benchmarks/results/<head>.json [--threshold 0.1]
+
+Exits non-zero when any stage of the head run is slower than the base by more than --threshold
+(relative) and --min-seconds (absolute).
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(base, head, threshold, min_seconds):
+    """Returns (rows of (size, stage, base_s, head_s, ratio, regressed), any_regression)."""
+    base_sizes = {s['rows']: s['median_s'] for s in base['sizes']}
+    table, regressed_any = [], False
+    for size in head['sizes']:
+        before = base_sizes.get(size['rows'])
+        if before is None:
+            continue
+        for stage in sorted(set(before) | set(size['median_s'])):
+            b, h = before.get(stage), size['median_s'].get(stage)
+            ratio = h / b if b and h is not None else None
+            regressed = ratio is not None and ratio > 1 + threshold and h - b > min_seconds
+            regressed_any |= regressed
+            table.append((size['rows'], stage, b, h, ratio, regressed))
+    return table, regressed_any
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown flagged as a regression")
+    parser.add_argument("--min-seconds", type=float, default=0.05,
+                        help="ignore slowdowns smaller than this many seconds (timer noise)")
+    args = parser.parse_args()
+    base, head = load(args.base), load(args.head)
+    print(f"base: {base.get('commit')}{' (dirty)' if base.get('dirty') else ''}")
+    print(f"head: {head.get('commit')}{' (dirty)' if head.get('dirty') else ''}")
+    if base.get('parameters') != head.get('parameters'):
+        print(f"warning: parameters differ\n  base: {base.get('parameters')}\n  head: {head.get('parameters')}")
+
+    table, regressed = compare(base, head, args.threshold, args.min_seconds)
+    fmt = lambda v: f"{v:.3f}" if v is not None else "-"
+    print(f"{'rows':>10}  {'stage':<32}{'base s':>10}{'head s':>10}{'ratio':>8}")
+    for rows, stage, b, h, ratio, flag in table:
+        print(f"{rows:>10}  {stage:<32}{fmt(b):>10}{fmt(h):>10}{fmt(ratio):>8}{'  REGRESSION' if flag else ''}")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Per-agent and end-to-end pipeline timings on synthetic maintenance logs, with the LLM client pointed
+at a local stub (benchmarks/stub_llm.py). Results are saved as JSON named after the current commit so
+two runs can be compared with benchmarks/compare.py.
+
+    python benchmarks/pipeline_benchmark.py [--rows 10000 1000000 10000000] [--repeat 3]
+                                            [--numeric-columns 2] [--chunksize 1000000] [--out benchmarks/results]
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from benchmarks import stub_llm, synthetic_data  # noqa: E402
+
+DEFAULT_ROWS = [10_000, 1_000_000, 10_000_000]
+
+
+def git_revision():
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    sha = git('rev-parse', 'HEAD')
+    dirty = bool(git('status', '--porcelain', '--untracked-files=no'))
+    return sha, dirty
+
+
+def environment():
+    import numpy
+    import pandas
+    return {
+        'python': platform.python_version(),
+        'pandas': pandas.__version__,
+        'numpy': numpy.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_once(pipeline, tracing, path, args, plot_dir):
+    """One load + full pipeline run under the tracer; returns wall seconds per span name."""
+    from agents.data_loading import compact_text_columns, load_dataset
+    from agents.dataset_profile import DatasetProfile
+    from agents.streaming_profile import StreamingProfile
+    tracer = tracing.enable()
+    try:
+        with tracing.span('load', 'io'):
+            if args.chunksize:
+                profile = StreamingProfile.from_csv(path, chunksize=args.chunksize, transform=compact_text_columns)
+                df = profile.data
+            else:
+                df = load_dataset(path)
+                profile = DatasetProfile(df)
+        with tracing.span('pipeline'):
+            pipeline.run_pipeline(df, profile=profile, plot_dir=plot_dir)
+    finally:
+        tracing.disable()
+    return {name: t['wall_s'] for name, t in tracer.summary().items()}
+
+
+def bench_size(pipeline, tracing, rows, args):
+    path = synthetic_data.cached_csv(args.cache_dir, rows, **synthetic_data.generator_params(args))
+    runs = []
+    with tempfile.TemporaryDirectory() as plot_dir:
+        for _ in range(args.repeat):
+            runs.append(run_once(pipeline, tracing, path, args, plot_dir))
+            gc.collect()
+    stages = sorted({name for run in runs for name in run})
+    return {
+        'rows': rows,
+        'csv_mb': round(os.path.getsize(path) / 2 ** 20, 1),
+        'median_s': {name: statistics.median(run.get(name, 0.0) for run in runs) for name in stages},
+        'runs': runs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="load through the chunked StreamingProfile path instead of one read_csv")
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="stub LLM response delay in seconds")
+    parser.add_argument("--cache-dir", default=os.path.join(ROOT, ".cache", "benchmarks"),
+                        help="where generated CSVs are kept between runs")
+    parser.add_argument("--out", default=os.path.join(ROOT, "benchmarks", "results"),
+                        help="directory for the <commit>.json result files")
+    synthetic_data.add_arguments(parser)
+    args = parser.parse_args()
+
+    server, url = stub_llm.start(delay=args.llm_delay)
+    # the client reads its endpoint at import time, so configure it before importing the pipeline
+    os.environ['ULTRASAFE_API_URL'] = url
+    os.environ.setdefault('ULTRASAFE_API_KEY', 'benchmark')
+    os.environ.pop('ULTRASAFE_CACHE_PATH', None)
+    import main as pipeline
+    from agents import tracing
+    # measure LLM plot planning on every run rather than plans stored by earlier runs
+    pipeline.viz_agent._plan_store = None
+
+    sha, dirty = git_revision()
+    results = {
+        'commit': sha,
+        'dirty': dirty,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment(),
+        'parameters': dict(synthetic_data.generator_params(args), repeat=args.repeat,
+                           chunksize=args.chunksize, llm_delay=args.llm_delay),
+        'sizes': [],
+    }
+    try:
+        for rows in args.rows:
+            start = time.perf_counter()
+            print(f"[benchmark] {rows} rows ...", flush=True)
+            size = bench_size(pipeline, tracing, rows, args)
+            results['sizes'].append(size)
+            print(f"[benchmark] {rows} rows done in {time.perf_counter() - start:.1f}s")
+            for name, seconds in sorted(size['median_s'].items(), key=lambda kv: kv[1], reverse=True):
+                print(f"    {name:<32}{seconds:>10.3f}s")
+    finally:
+        server.shutdown()
+
+    os.makedirs(args.out, exist_ok=True)
+    name = f"{(sha or 'unknown')[:12]}{'-dirty' if dirty else ''}.json"
+    out_path = os.path.join(args.out, name)
+    with open(out_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Load test for server.py: starts the stub LLM (benchmarks/stub_llm.py) and the server, submits jobs
+from several client threads, backs off on 503 (Retry-After), polls each job to completion and reports
+throughput, latency percentiles, queue wait and rejections.
+
+    python benchmarks/server_load_test.py [--jobs 20] [--clients 4] [--workers 2] [--max-queue 4]
+                                          [--rows 10000] [--upload] [--llm-delay 0.5] [--json out.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from benchmarks import stub_llm, synthetic_data  # noqa: E402
+
+
+def request(url, data=None, content_type=None):
+    """Returns (status, headers, body bytes) without raising on HTTP errors."""
+    req = urllib.request.Request(url, data=data, method='POST' if data is not None else 'GET')
+    if content_type:
+        req.add_header('Content-Type', content_type)
+    try:
+        with urllib.request.urlopen(req, timeout=600) as resp:
+            return resp.status, resp.headers, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def wait_ready(base_url, server, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with code {server.returncode}")
+        try:
+            if request(base_url + 'health')[0] == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server not ready after {timeout}s")
+
+
+def run_job(base_url, csv_path, upload, poll_interval):
+    """Submit one job (retrying on 503) and poll it; returns a result record."""
+    record = {'rejected': 0}
+    start = time.perf_counter()
+    while True:
+        if upload:
+            with open(csv_path, 'rb') as f:
+                status, headers, body = request(base_url + 'jobs', f.read(), 'text/csv')
+        else:
+            status, headers, body = request(base_url + 'jobs', json.dumps({'path': csv_path}).encode(),
+                                            'application/json')
+        if status != 503:
+            break
+        record['rejected'] += 1
+        time.sleep(float(headers.get('Retry-After', 1)))
+    if status != 202:
+        return dict(record, status=f'submit failed ({status})', latency_s=time.perf_counter() - start)
+    job_url = base_url + f"jobs/{json.loads(body)['id']}"
+    while True:
+        job = json.loads(request(job_url)[2])
+        if job['status'] in ('done', 'error'):
+            break
+        time.sleep(poll_interval)
+    record.update(status=job['status'], latency_s=time.perf_counter() - start, **job.get('timing', {}))
+    if job['status'] == 'done':
+        # fetch the report to check artifacts are served
+        report = next(a for a in job['artifacts'] if a.endswith('.md'))
+        record['report_bytes'] = len(request(f"{job_url}/artifacts/{report}")[2])
+        record['artifacts'] = len(job['artifacts'])
+    return record
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))] if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--clients", type=int, default=4, help="concurrent submitting clients")
+    parser.add_argument("--workers", type=int, default=2, help="server worker processes")
+    parser.add_argument("--max-queue", type=int, default=4, help="server queue limit (exercises backpressure)")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--upload", action="store_true", help="upload the CSV body instead of passing its path")
+    parser.add_argument("--llm-delay", type=float, default=0.5, help="stub LLM response delay in seconds")
+    parser.add_argument("--port", type=int, default=8001, help="port for the server under test")
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    parser.add_argument("--json", help="also write the results to this file")
+    synthetic_data.add_arguments(parser)
+    args = parser.parse_args()
+
+    csv_path = synthetic_data.cached_csv(os.path.join(ROOT, ".cache", "benchmarks"), args.rows,
+                                         **synthetic_data.generator_params(args))
+    stub, llm_url = stub_llm.start(delay=args.llm_delay)
+    env = dict(os.environ, ULTRASAFE_API_URL=llm_url, ULTRASAFE_API_KEY=os.environ.get('ULTRASAFE_API_KEY', 'benchmark'))
+    env.pop('ULTRASAFE_CACHE_PATH', None)
+    base_url = f"http://127.0.0.1:{args.port}/"
+    with tempfile.TemporaryDirectory() as jobs_dir:
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'server.py'), '--port', str(args.port), '--workers', str(args.workers),
+             '--max-queue', str(args.max_queue), '--jobs-dir', jobs_dir, '--data-root', os.path.dirname(csv_path),
+             '--no-stream'],
+            cwd=ROOT, env=env)
+        try:
+            ready_start = time.perf_counter()
+            wait_ready(base_url, server, timeout=300)
+            startup_s = time.perf_counter() - ready_start
+            print(f"[load-test] server ready in {startup_s:.1f}s; {args.jobs} jobs from {args.clients} clients")
+
+            records, lock = [], threading.Lock()
+            todo = iter(range(args.jobs))
+
+            def client():
+                while True:
+                    with lock:
+                        if next(todo, None) is None:
+                            return
+                    record = run_job(base_url, csv_path, args.upload, args.poll_interval)
+                    with lock:
+                        records.append(record)
+
+            start = time.perf_counter()
+            threads = [threading.Thread(target=client) for _ in range(args.clients)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            wall_s = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+            stub.shutdown()
+
+    done = [r for r in records if r['status'] == 'done']
+    latencies = [r['latency_s'] for r in done]
+    queue_waits = [r['queue_seconds'] for r in done if r.get('queue_seconds') is not None]
+    results = {
+        'jobs': args.jobs, 'clients': args.clients, 'workers': args.workers, 'max_queue': args.max_queue,
+        'rows': args.rows, 'upload': args.upload, 'llm_delay': args.llm_delay,
+        'server_startup_s': round(startup_s, 3),
+        'wall_s': round(wall_s, 3),
+        'throughput_jobs_per_s': round(len(done) / wall_s, 3),
+        'completed': len(done),
+        'failed': len(records) - len(done),
+        'rejections': sum(r['rejected'] for r in records),
+        'latency_s': {'p50': percentile(latencies, 0.5), 'p95': percentile(latencies, 0.95), 'max': max(latencies, default=None)},
+        'queue_wait_s': {'p50': percentile(queue_waits, 0.5), 'max': max(queue_waits, default=None)},
+        'run_s_median': statistics.median([r['run_seconds'] for r in done]) if done else None,
+    }
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0 if not results['failed'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
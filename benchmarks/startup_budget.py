@@ -0,0 +1,46 @@
+"""
+Cold-start import time check for the agents package: exits non-zero when the median wall time of
+importing the agent modules in a fresh interpreter exceeds the budget.
+
+    python benchmarks/startup_budget.py --budget 1.5 [--runs 5] [--module main] [--json results.json]
+
+tests/test_startup_budget.py runs the same check under pytest.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agents.startup_profile import AGENT_MODULES, STARTUP_BUDGET, format_report, profile_imports  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET,
+                        help="allowed median import wall time in seconds (default: $STARTUP_BUDGET or 1.5)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--module", action="append", dest="modules",
+                        help="module to import (repeatable; default: the agent modules used by main.py)")
+    parser.add_argument("--json", help="write the measurements to this file")
+    args = parser.parse_args()
+    modules = args.modules or list(AGENT_MODULES)
+
+    runs = [profile_imports(modules) for _ in range(args.runs)]
+    walls = [wall for _, wall in runs]
+    median = statistics.median(walls)
+    records, _ = min(runs, key=lambda run: abs(run[1] - median))
+    print(format_report(records, median))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({'modules': modules, 'budget_s': args.budget, 'wall_s': walls, 'median_s': median}, f, indent=2)
+
+    over = median > args.budget
+    print(f"\nMedian cold import of {', '.join(modules)}: {median:.3f}s "
+          f"({'OVER' if over else 'within'} the {args.budget:.3f}s budget)")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Local stand-in for the UltraSafe chat completions endpoint, so pipeline timings exclude the network
+and the real model. Answers the visualization prompt with a plot plan for the columns it mentions and
+any other prompt with a short Markdown report; supports stream=True (server-sent events).
+
+    python benchmarks/stub_llm.py --port 8765 --delay 0.5
+    ULTRASAFE_API_URL=http://127.0.0.1:8765/ python main.py
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def plot_plan(prompt):
+    columns = re.search(r'"columns":\s*\[(.*?)\]', prompt, re.DOTALL)
+    columns = re.findall(r'"([^"]+)"', columns.group(1)) if columns else []
+    dtypes = dict(re.findall(r'"([^"]+)":\s*"(float\d*|int\d*)"', prompt))
+    numeric = [c for c in columns if c in dtypes]
+    text = [c for c in columns if c not in dtypes]
+    plan = [{'plot_type': 'heatmap', 'columns': ['missing'], 'description': 'Missing values'}]
+    if text:
+        plan.append({'plot_type': 'bar', 'columns': text[:1], 'description': f'Most frequent {text[0]}'})
+        plan.append({'plot_type': 'pie', 'columns': text[-1:], 'description': f'Share of {text[-1]}'})
+    if numeric:
+        plan.append({'plot_type': 'histogram', 'columns': numeric[:1], 'description': f'Distribution of {numeric[0]}'})
+        plan.append({'plot_type': 'boxplot', 'columns': numeric[:1], 'description': f'Spread of {numeric[0]}'})
+    if len(numeric) > 1:
+        plan.append({'plot_type': 'scatter', 'columns': numeric[:2], 'description': f'{numeric[0]} vs {numeric[1]}'})
+    return plan
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    delay = 0.0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        prompt = body['messages'][-1]['content']
+        time.sleep(self.delay)
+        if 'visualization expert' in prompt:
+            plan = plot_plan(prompt)
+            content = json.dumps({'plots': plan} if body.get('response_format') else plan)
+        else:
+            content = f"# Insight Report\n\nStub report for a {len(prompt)}-character prompt.\n"
+        if body.get('stream'):
+            self._stream(content)
+        else:
+            self._json({'choices': [{'message': {'role': 'assistant', 'content': content}}],
+                        'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(content) // 4}})
+
+    def _json(self, payload):
+        out = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def _stream(self, content):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        events = [f"data: {json.dumps({'choices': [{'delta': {'content': content[i:i + 16]}}]})}\n\n"
+                  for i in range(0, len(content), 16)] + ["data: [DONE]\n\n"]
+        for event in events:
+            chunk = event.encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+
+def start(port=0, delay=0.0):
+    """Serve the stub in a daemon thread; returns (server, url). port=0 picks a free port."""
+    handler = type('Handler', (StubHandler,), {'delay': delay})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering")
+    args = parser.parse_args()
+    handler = type('Handler', (StubHandler,), {'delay': args.delay})
+    print(f"Stub LLM listening on http://127.0.0.1:{args.port}/")
+    ThreadingHTTPServer(('127.0.0.1', args.port), handler).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
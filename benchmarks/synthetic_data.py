@@ -0,0 +1,133 @@
+"""
+Synthetic maintenance logs shaped like sample_data/Aircraft_Annotation_DataFile.csv
+(IDENT, PROBLEM, ACTION), with control over size, cardinality, skew, nulls and extra numeric columns.
+
+    python benchmarks/synthetic_data.py out.csv --rows 1000000 [--problems 5000] [--zipf 1.1]
+                                        [--null-rate 0.01] [--numeric-columns 2] [--seed 0]
+"""
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+LOCATIONS = ['#1 CYL', '#2 CYL', '#3 CYL', '#4 CYL', 'L/H ENGINE', 'R/H ENGINE', 'ENGINE', 'LWR COWL']
+PARTS = ['INTAKE GASKET', 'ROCKER COVER GASKET', 'BAFFLE SEAL', 'OIL RETURN LINE', 'EXHAUST VALVE',
+         'FUEL SERVO', 'SPARK PLUG', 'MAGNETO', 'ALTERNATOR BELT', 'OIL COOLER', 'PUSHROD TUBE',
+         'ENGINE MOUNT', 'IDLE MIXTURE', 'CARB HEAT CABLE', 'FUEL INJECTOR LINE']
+DEFECTS = ['LEAKING', 'LOOSE', 'CRACKED', 'WORN', 'MISSING', 'DAMAGED', 'LOW COMPRESSION',
+           'INOPERATIVE', 'CHAFED', 'SAFETY WIRE BROKEN']
+REMEDIES = ['REMOVED & REPLACED', 'TIGHTENED', 'SAFETY WIRED', 'CLEANED & INSPECTED', 'ADJUSTED',
+            'REPAIRED', 'OPS CK GOOD, NO DEFECT FOUND', 'RESEALED']
+# appended to base phrases once the requested cardinality exceeds the distinct combinations,
+# mimicking the wording/punctuation variants of hand-typed logs
+VARIANTS = ['.', ' ON INSPECTION.', ' REPORTED BY PILOT.', ', SEE WO', ' NOTED ON RUN UP.', ' (REPEAT)']
+
+
+def vocabulary(size, templates, rng):
+    """`size` distinct strings built from the product of `templates` (lists of words), then variants."""
+    grids = np.meshgrid(*[np.arange(len(t)) for t in templates], indexing='ij')
+    combos = [' '.join(w for w in (t[i] for t, i in zip(templates, idx)) if w)
+              for idx in zip(*(g.ravel() for g in grids))]
+    combos = [combos[i] for i in rng.permutation(len(combos))]
+    words = []
+    for i in range(size):
+        base, round_ = combos[i % len(combos)], i // len(combos)
+        if round_ == 0:
+            words.append(base)
+        elif round_ <= len(VARIANTS):
+            words.append(base + VARIANTS[round_ - 1])
+        else:
+            words.append(f"{base} WO#{round_}")
+    return np.array(words, dtype=object)
+
+
+def zipf_probabilities(n, s):
+    """P(rank k) proportional to 1 / k**s over n categories (s=0 is uniform)."""
+    weights = 1.0 / np.arange(1, n + 1) ** s
+    return weights / weights.sum()
+
+
+class Generator:
+    """Draws chunks of synthetic rows; identical parameters always yield identical data."""
+
+    def __init__(self, problems=5000, actions=2000, zipf=1.1, null_rate=0.01, numeric_columns=0, seed=0):
+        self.params = {'problems': problems, 'actions': actions, 'zipf': zipf, 'null_rate': null_rate,
+                       'numeric_columns': numeric_columns, 'seed': seed}
+        rng = np.random.default_rng(seed)
+        self.problem_vocab = vocabulary(problems, [LOCATIONS, PARTS, DEFECTS], rng)
+        self.action_vocab = vocabulary(actions, [REMEDIES, PARTS, LOCATIONS], rng)
+        self.problem_p = zipf_probabilities(problems, zipf)
+        self.action_p = zipf_probabilities(actions, zipf)
+        # numeric columns depend on the problem so group tests have something to find
+        self.problem_effects = rng.lognormal(0.0, 0.5, size=(numeric_columns, problems))
+        self._rng = rng
+        self._next_ident = 100001
+
+    def chunk(self, rows):
+        rng = self._rng
+        problem_codes = rng.choice(len(self.problem_vocab), size=rows, p=self.problem_p)
+        action_codes = rng.choice(len(self.action_vocab), size=rows, p=self.action_p)
+        null_problem = rng.random(rows) < self.params['null_rate']
+        null_action = rng.random(rows) < self.params['null_rate']
+        data = {
+            'IDENT': np.arange(self._next_ident, self._next_ident + rows),
+            'PROBLEM': pd.Categorical.from_codes(np.where(null_problem, -1, problem_codes), self.problem_vocab),
+            'ACTION': pd.Categorical.from_codes(np.where(null_action, -1, action_codes), self.action_vocab),
+        }
+        for i in range(self.params['numeric_columns']):
+            values = self.problem_effects[i][problem_codes] * rng.lognormal(3.0, 0.4, size=rows)
+            values[rng.random(rows) < self.params['null_rate']] = np.nan
+            data[f'METRIC_{i + 1}'] = values.round(2)
+        self._next_ident += rows
+        return pd.DataFrame(data)
+
+
+def write_csv(path, rows, chunksize=1_000_000, **params):
+    """Write `rows` synthetic rows to `path` in chunks (bounded memory); returns the path."""
+    generator = Generator(**params)
+    with open(path, 'w', newline='') as f:
+        for start in range(0, rows, chunksize):
+            generator.chunk(min(chunksize, rows - start)).to_csv(f, index=False, header=(start == 0))
+    return path
+
+
+def cached_csv(cache_dir, rows, **params):
+    """Path to a synthetic CSV for these parameters, generated on first use and reused afterwards."""
+    key = hashlib.sha1(json.dumps(dict(params, rows=rows), sort_keys=True).encode()).hexdigest()[:12]
+    path = os.path.join(cache_dir, f"synthetic_{rows}_{key}.csv")
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        write_csv(path + '.tmp', rows, **params)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def add_arguments(parser):
+    parser.add_argument("--problems", type=int, default=5000, help="distinct PROBLEM strings")
+    parser.add_argument("--actions", type=int, default=2000, help="distinct ACTION strings")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of the frequencies (0 = uniform)")
+    parser.add_argument("--null-rate", type=float, default=0.01, help="fraction of missing PROBLEM/ACTION values")
+    parser.add_argument("--numeric-columns", type=int, default=0, help="extra numeric METRIC_<i> columns")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def generator_params(args):
+    return {'problems': args.problems, 'actions': args.actions, 'zipf': args.zipf,
+            'null_rate': args.null_rate, 'numeric_columns': args.numeric_columns, 'seed': args.seed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=10_000)
+    add_arguments(parser)
+    args = parser.parse_args()
+    write_csv(args.path, args.rows, **generator_params(args))
+    print(f"Wrote {args.rows} rows to {args.path} ({os.path.getsize(args.path) / 2 ** 20:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Memory/time comparison of the PROBLEM/ACTION load paths (object vs categorical vs Arrow strings)
+on a scaled-up copy of the sample CSV.
+
+    python benchmarks/text_columns_benchmark.py --scale 100 [--normalize] [--json results.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agents.data_loading import TEXT_MODES, load_dataset  # noqa: E402
+
+SAMPLE_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          "sample_data", "Aircraft_Annotation_DataFile.csv")
+
+
+def scale_csv(src, factor, dst):
+    base = pd.read_csv(src)
+    frames = []
+    for i in range(factor):
+        part = base.copy()
+        part['IDENT'] = part['IDENT'] + i * len(base)
+        frames.append(part)
+    pd.concat(frames, ignore_index=True).to_csv(dst, index=False)
+    return len(base) * factor
+
+
+def _timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def bench_mode(path, mode, normalize):
+    start = time.perf_counter()
+    df = load_dataset(path, text_mode=mode, normalize=normalize)
+    load_s = time.perf_counter() - start
+    problem = df['PROBLEM']
+    top = problem.value_counts().head(10).index
+    return {
+        'mode': mode,
+        'load_s': load_s,
+        'memory_mb': df[['PROBLEM', 'ACTION']].memory_usage(deep=True).sum() / 2 ** 20,
+        'value_counts_s': _timed(lambda: problem.value_counts()),
+        'nunique_s': _timed(lambda: problem.nunique()),
+        'groupby_s': _timed(lambda: df.groupby('PROBLEM', observed=True)['IDENT'].size()),
+        'isin_s': _timed(lambda: problem.isin(top)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--csv", default=SAMPLE_CSV)
+    parser.add_argument("--scale", type=int, default=100, help="number of copies of the input to concatenate")
+    parser.add_argument("--normalize", action="store_true")
+    parser.add_argument("--modes", nargs="+", default=list(TEXT_MODES), choices=TEXT_MODES)
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "scaled.csv")
+        rows = scale_csv(args.csv, args.scale, path)
+        print(f"{rows} rows ({os.path.getsize(path) / 2 ** 20:.1f} MB CSV), normalize={args.normalize}")
+        results = []
+        for mode in args.modes:
+            try:
+                results.append(bench_mode(path, mode, args.normalize))
+            except ImportError as e:
+                print(f"skipping {mode}: {e}")
+
+    cols = ['mode', 'load_s', 'memory_mb', 'value_counts_s', 'nunique_s', 'groupby_s', 'isin_s']
+    print(" ".join(f"{c:>14}" for c in cols))
+    for r in results:
+        print(" ".join(f"{r[c]:>14}" if isinstance(r[c], str) else f"{r[c]:>14.4f}" for c in cols))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({'rows': rows, 'normalize': args.normalize, 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,16 @@
-import os
+from agents.rag_retriever import KnowledgeBaseIndex
+
 
 class KnowledgeBaseRetriever:
-    def __init__(self, kb_dir):
+    """
+    Ranked chunk retrieval over the .md/.txt files in `kb_dir` (see agents/rag_retriever.py).
+    Import it as knowledge_base.retriever with the repository root on the path (as main.py runs).
+    """
+
+    def __init__(self, kb_dir, dense=False):
         self.kb_dir = kb_dir
-        self.files = [f for f in os.listdir(kb_dir) if f.endswith('.md')]
-
-    def retrieve(self, query):
-        results = []
-        for file in self.files:
-            with open(os.path.join(self.kb_dir, file), 'r') as f:
-                content = f.read()
-                if query.lower() in content.lower():
-                    results.append({"file": file, "content": content})
-        return results 
\ No newline at end of file
+        self.index = KnowledgeBaseIndex(kb_dir, dense=dense)
+
+    def retrieve(self, query, k=5):
+        self.index.refresh()
+        return self.index.search(query, k)
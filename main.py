@@ -1,16 +1,33 @@
-import pandas as pd
+import argparse
+import asyncio
+import contextlib
+import glob
+import json
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from agents.data_exploration_agent import DataExplorationAgent
 from agents.statistical_analysis_agent import StatisticalAnalysisAgent
 from agents.visualization_agent import VisualizationAgent
 from agents.insight_generation_agent import InsightGenerationAgent
-from agents.rag_retriever import retrieve
+from agents import rag_retriever
+from agents.rag_retriever import retrieve_many
+from agents.dataset_profile import DatasetProfile
+from agents.streaming_profile import StreamingProfile
+from agents.incremental import IncrementalState, SourceMismatchError
+from agents.plan_store import PlanStore
+from agents.data_loading import TEXT_MODES, compact_text_columns, load_dataset
+from agents.dag_runner import Stage, run_dag
+from agents import tracing
+from ultrasafe_client.ultrasafe import UltraSafe
 from dotenv import load_dotenv
 import os
 from datetime import datetime
 load_dotenv()
 
-# Load dataset
-df = pd.read_csv("sample_data/Aircraft_Annotation_DataFile.csv")
+DATA_PATH = "sample_data/Aircraft_Annotation_DataFile.csv"
+STATE_PATH = "insights/.incremental_state.json"
 # Set prompt directory
 PROMPT_DIR = os.path.join(os.path.dirname(__file__), 'prompts')
 
@@ -29,7 +46,8 @@ viz_agent = VisualizationAgent(
     role="Visualization Expert",
     goal="Create clear and informative charts to communicate findings.",
     backstory="A data visualization specialist for technical datasets.",
-    prompt_dir=PROMPT_DIR
+    prompt_dir=PROMPT_DIR,
+    plan_store=PlanStore()
 )
 insight_agent = InsightGenerationAgent(
     role="Insight Generator",
@@ -38,50 +56,360 @@ insight_agent = InsightGenerationAgent(
     prompt_dir=PROMPT_DIR
 )
 
-# Data Exploration
-exploration_summary = explorer_agent.analyze(df)
 
-# Use RAG retriever for relevant methods and best practices
-relevant_methods = retrieve("statistical methods", k=3)
-best_practices = retrieve("best practices", k=3)
+class _Tee:
+    """Minimal file-like object that mirrors writes to several streams."""
 
-# Statistical Analysis
-analysis_results = stats_agent.analyze(df, exploration_summary)
+    def __init__(self, *streams):
+        self.streams = streams
 
-# Visualization
-visualizations = viz_agent.visualize(df, analysis_results, exploration_summary)
+    def write(self, text):
+        for stream in self.streams:
+            stream.write(text)
+
+    def flush(self):
+        for stream in self.streams:
+            stream.flush()
+
+
+@contextlib.contextmanager
+def _quiet(echo):
+    """Discards the agents' progress output unless `echo`; batch and server workers run with echo=False."""
+    if echo:
+        yield
+        return
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def run_pipeline(df, stream_to=None, profile=None, memos=None, cluster_problems=False, plot_dir='visualizations'):
+    # Column statistics shared by all agents
+    profile = profile or DatasetProfile(df)
+    # Memoized LLM results (incremental mode), reused while their context is unchanged
+    memos = memos or {}
+
+    # Data Exploration
+    exploration_summary = explorer_agent.analyze(df, profile, cluster_problems)
+
+    # Use RAG retriever for relevant methods and best practices
+    relevant_methods, best_practices = retrieve_many(["statistical methods", "best practices"], k=3)
+
+    # Statistical Analysis
+    analysis_results = stats_agent.analyze(df, exploration_summary, profile)
+
+    # Visualization
+    visualizations = viz_agent.visualize(df, analysis_results, exploration_summary, profile,
+                                        plan_memo=memos.get('plot_plan'), output_dir=plot_dir)
+
+    # LLM-driven Insight Generation: pass all outputs as context
+    return insight_agent.generate_insights(
+        exploration_summary,
+        analysis_results,
+        visualizations,
+        relevant_methods,
+        best_practices,
+        stream_to=stream_to,
+        report_memo=memos.get('insights')
+    )
+
+
+async def run_pipeline_concurrent(df, stream_to=None, profile=None, memos=None, cluster_problems=False,
+                                  plot_dir='visualizations'):
+    """
+    Same stages as run_pipeline(), scheduled as a DAG: exploration, statistics and RAG retrieval
+    run side by side, visualization waits for exploration and statistics, and insight generation
+    joins on everything.
+    """
+    profile = profile or DatasetProfile(df)
+    memos = memos or {}
+    stages = [
+        Stage("exploration", lambda: explorer_agent.analyze(df, profile, cluster_problems)),
+        Stage("rag", lambda: retrieve_many(["statistical methods", "best practices"], k=3)),
+        # StatisticalAnalysisAgent does not read the exploration summary, so statistics runs alongside exploration
+        Stage("statistics", lambda: stats_agent.analyze(df, None, profile)),
+        Stage("visualization", lambda exploration, stats: viz_agent.avisualize(
+                  df, stats, exploration, profile, plan_memo=memos.get('plot_plan'), output_dir=plot_dir),
+              deps=["exploration", "statistics"]),
+        Stage("insights", lambda exploration, stats, plots, rag: insight_agent.agenerate_insights(
+                  exploration, stats, plots, *rag, stream_to=stream_to, report_memo=memos.get('insights')),
+              deps=["exploration", "statistics", "visualization", "rag"]),
+    ]
+    try:
+        results, timings = await run_dag(stages)
+    finally:
+        await UltraSafe.chat.Completions.aclose()
+    for name, t in sorted(timings.items(), key=lambda kv: kv[1]["start"]):
+        print(f"[pipeline] {name}: {t['start']:.2f}s -> {t['end']:.2f}s ({t['duration']:.2f}s)")
+    return results["insights"]
+
+
+def build_appendix():
+    # Append full content of knowledge base files to the report (optional, can be removed if only using RAG);
+    # the text comes from the chunks cached by the RAG index rather than a second read of the files
+    appendix = "\n\n---\n\n"
+    try:
+        appendix += "## Appendix: Statistical Methods\n\n" + rag_retriever.document('statistical_methods.md') + "\n"
+    except Exception as e:
+        appendix += f"## Appendix: Statistical Methods\n\nError loading file: {e}\n"
+    try:
+        appendix += "\n## Appendix: Best Practices\n\n" + rag_retriever.document('best_practices.md') + "\n"
+    except Exception as e:
+        appendix += f"\n## Appendix: Best Practices\n\nError loading file: {e}\n"
+    return appendix
+
+
+def analyze_file(data_path, args, report_dir='insights', plot_dir='visualizations', state_path=None, echo=True):
+    """
+    Load `data_path`, run the pipeline over it and write its insight report under `report_dir`.
+    With echo=False nothing is written to stdout, the agents' messages included (batch and server
+    workers). Returns a summary for the run manifest.
+    With args.trace, the run's spans are exported as a Chrome trace next to the report.
+    """
+    tracer = tracing.enable() if args.trace else None
+    try:
+        with _quiet(echo):
+            summary = _analyze_file(data_path, args, report_dir, plot_dir, state_path, echo)
+    finally:
+        if tracer is not None:
+            tracing.disable()
+    if tracer is not None:
+        summary['trace'] = tracer.export(os.path.splitext(summary['report'])[0] + '.trace.json')
+        if echo:
+            for name, t in sorted(tracer.summary().items(), key=lambda kv: kv[1]['wall_s'], reverse=True):
+                print(f"[trace] {name}: {t['count']}x, {t['wall_s']:.3f}s wall (max {t['max_s']:.3f}s), {t['cpu_s']:.3f}s CPU")
+            print(f"Trace saved to {summary['trace']}")
+    return summary
+
+
+def _load_data(data_path, args, state_path=None):
+    """Returns (df, profile, incremental state or None) for `data_path` per the loading options in `args`."""
+    transform = lambda chunk: compact_text_columns(chunk, mode=args.text_dtype, normalize=args.normalize_text)
+    state = None
+    if args.incremental:
+        state_path = state_path or args.state
+        state = IncrementalState.load(state_path, sample_size=args.sample_size)
+        new_rows = state.fold_csv(data_path, chunksize=args.chunksize or 100_000, transform=transform)
+        profile = state.profile
+        df = profile.data
+        resumed = state.source['resumed_from']
+        print(f"[main] Folded {new_rows} new rows (up to IDENT {state.last_ident}"
+              f"{f', read from byte {resumed}' if resumed else ''}); {profile.n_rows} rows aggregated in {state_path}.")
+    elif args.chunksize:
+        profile = StreamingProfile.from_csv(
+            data_path, chunksize=args.chunksize, sample_size=args.sample_size,
+            transform=transform)
+        df = profile.data
+        print(f"[main] Streamed {profile.n_rows} rows; using a {len(df)}-row sample for row-level statistics.")
+    else:
+        df = load_dataset(data_path, text_mode=args.text_dtype, normalize=args.normalize_text)
+        profile = DatasetProfile(df)
+    return df, profile, state
+
+
+def _analyze_file(data_path, args, report_dir, plot_dir, state_path, echo):
+    start = time.perf_counter()
+    with tracing.span('load', 'io', path=data_path) as span:
+        df, profile, state = _load_data(data_path, args, state_path)
+        span.set(rows=profile.n_rows)
+    load_seconds = time.perf_counter() - start
+
+    # The LLM report is streamed into the insights file (and stdout) as it arrives,
+    # followed by the knowledge base appendix
+    os.makedirs(report_dir, exist_ok=True)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    insight_md_path = os.path.join(report_dir, f'insight_report_{timestamp}.md')
+    with open(insight_md_path, 'w') as f:
+        sink = None if args.no_stream else (_Tee(f, sys.stdout) if echo else f)
+        memos = state.llm_memos if state else None
+        with tracing.span('pipeline', concurrent=args.concurrent):
+            if args.concurrent:
+                llm_report = asyncio.run(run_pipeline_concurrent(
+                    df, stream_to=sink, profile=profile, memos=memos, cluster_problems=args.cluster_problems,
+                    plot_dir=plot_dir))
+            else:
+                llm_report = run_pipeline(df, stream_to=sink, profile=profile, memos=memos,
+                                          cluster_problems=args.cluster_problems, plot_dir=plot_dir)
+        appendix = build_appendix()
+        if sink is None:
+            f.write(llm_report)
+            if echo:
+                print("\n==== FINAL INSIGHT REPORT ====\n")
+                print(llm_report + appendix)
+        elif echo:
+            print(appendix)
+        f.write(appendix)
+    if echo:
+        print(f"\nInsight report saved to {insight_md_path}\n")
+    if state:
+        state.save()
+    return {
+        'data': data_path,
+        'report': insight_md_path,
+        'rows': profile.n_rows,
+        'load_seconds': round(load_seconds, 3),
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+# Batch mode: one pipeline run per CSV, spread over a process pool. Each worker imports this module
+# once (agents, pandas, matplotlib) and, in its initializer, builds the chunked knowledge-base index
+# (BM25 postings plus the persisted chunk vectors) and loads the embedding model to encode the RAG
+# queries, so no file pays for either.
+_batch_args = None
+
+
+def _batch_files(pattern):
+    if os.path.isdir(pattern):
+        return sorted(glob.glob(os.path.join(pattern, '*.csv')))
+    return sorted(glob.glob(pattern))
+
+
+def _batch_stems(files):
+    # report/plot directory per file, disambiguated when two files share a name
+    stems, seen = [], {}
+    for path in files:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        seen[stem] = seen.get(stem, 0) + 1
+        stems.append(stem if seen[stem] == 1 else f"{stem}_{seen[stem]}")
+    return stems
+
+
+def _init_batch_worker(args, llm_slots):
+    global _batch_args
+    _batch_args = args
+    # LLM calls from every worker share one cross-process limit
+    UltraSafe.chat.Completions.configure_concurrency(llm_slots)
+    # the batch pool already occupies the cores; render plots in-process
+    viz_agent._render_workers = 1
+    if args.no_plan_store:
+        viz_agent._plan_store = None
+    with _quiet(echo=False):
+        # builds the knowledge-base index and caches the pipeline's RAG results
+        retrieve_many(["statistical methods", "best practices"], k=3)
+        if args.cluster_problems:
+            rag_retriever._get_model()
+
+
+def _run_batch_file(path, stem):
+    UltraSafe.chat.Completions.metrics.reset()
+    try:
+        summary = analyze_file(
+            path, _batch_args,
+            report_dir=os.path.join('insights', stem),
+            plot_dir=os.path.join('visualizations', stem),
+            state_path=os.path.join('insights', stem, os.path.basename(STATE_PATH)),
+            echo=False)
+        summary['status'] = 'ok'
+    except Exception as e:
+        summary = {'data': path, 'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+    summary['worker'] = os.getpid()
+    summary['llm'] = UltraSafe.chat.Completions.metrics.summary()
+    return summary
+
+
+def run_batch(args):
+    """Analyze every CSV matched by args.batch in a process pool and write a run manifest under insights/."""
+    files = _batch_files(args.batch)
+    if not files:
+        print(f"[batch] No CSV files match {args.batch}")
+        return 1
+    workers = args.workers or min(len(files), os.cpu_count() or 1)
+    print(f"[batch] {len(files)} files, {workers} workers, at most {args.max_llm_concurrency} concurrent LLM calls")
+    started = datetime.now().isoformat(timespec='seconds')
+    start = time.perf_counter()
+    ctx = multiprocessing.get_context()
+    llm_slots = ctx.BoundedSemaphore(args.max_llm_concurrency)
+    order = {path: i for i, path in enumerate(files)}
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_batch_worker, initargs=(args, llm_slots)) as pool:
+        futures = {pool.submit(_run_batch_file, path, stem): path for path, stem in zip(files, _batch_stems(files))}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                summary = future.result()
+            except Exception as e:
+                summary = {'data': futures[future], 'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+            results.append(summary)
+            took = f"{summary['seconds']:.2f}s" if 'seconds' in summary else summary['error']
+            print(f"[batch] ({done}/{len(files)}) {summary['data']}: {summary['status']} ({took})")
+
+    manifest = {
+        'started': started,
+        'seconds': round(time.perf_counter() - start, 3),
+        'workers': workers,
+        'max_llm_concurrency': args.max_llm_concurrency,
+        'files': sorted(results, key=lambda r: order[r['data']]),
+    }
+    os.makedirs('insights', exist_ok=True)
+    manifest_path = os.path.join('insights', f"batch_manifest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    failed = sum(r['status'] != 'ok' for r in results)
+    print(f"[batch] {len(files) - failed}/{len(files)} files analyzed in {manifest['seconds']:.1f}s; manifest: {manifest_path}")
+    return 1 if failed else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run the maintenance-log analysis pipeline.")
+    parser.add_argument("--data", default=DATA_PATH, help="CSV file to analyze")
+    parser.add_argument("--batch", metavar="DIR_OR_GLOB",
+                        help="analyze every CSV in a directory (or matching a glob) in a process pool; "
+                             "each file gets its report under insights/<name>/ and plots under visualizations/<name>/")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes used with --batch (default: one per core, at most one per file)")
+    parser.add_argument("--max-llm-concurrency", type=int, default=4,
+                        help="LLM requests in flight across all --batch workers (default: 4)")
+    parser.add_argument("--concurrent", action="store_true",
+                        help="run independent stages concurrently with the async LLM client")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="read the CSV in chunks of this many rows with bounded memory; "
+                             "row-level statistics and plots then use a reservoir sample")
+    parser.add_argument("--sample-size", type=int, default=100_000,
+                        help="reservoir sample size used with --chunksize")
+    parser.add_argument("--text-dtype", choices=TEXT_MODES, default="category",
+                        help="storage for the PROBLEM/ACTION text columns (default: category)")
+    parser.add_argument("--normalize-text", action="store_true",
+                        help="upper-case PROBLEM/ACTION text and strip whitespace/trailing punctuation")
+    parser.add_argument("--cluster-problems", action="store_true",
+                        help="group near-duplicate PROBLEM wordings with sentence embeddings and report cluster frequencies")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only fold rows appended since the last run (read from the saved byte offset; rows "
+                             "with an IDENT above the last processed one if the file was rewritten) into the "
+                             "aggregates persisted in --state, and reuse LLM results while their context is unchanged")
+    parser.add_argument("--state", default=STATE_PATH,
+                        help=f"state file used with --incremental (default: {STATE_PATH}; "
+                             "with --batch, one per file under insights/<name>/)")
+    parser.add_argument("--no-stream", action="store_true",
+                        help="wait for the full LLM report instead of streaming it")
+    parser.add_argument("--no-plan-store", action="store_true",
+                        help="always ask the LLM for a plot plan instead of reusing the one stored for "
+                             "datasets with the same schema fingerprint (.cache/plot_plans.sqlite)")
+    parser.add_argument("--trace", action="store_true",
+                        help="record per-stage spans (wall/CPU time, peak RSS growth, LLM tokens) and save them "
+                             "as a Chrome trace (<report>.trace.json) next to the insight report")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="report the cold-start import time of this script per package/module and exit")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+
+    if args.profile_startup:
+        from agents.startup_profile import format_report, profile_imports
+        print(format_report(*profile_imports(['main'])))
+        return 0
+    if args.no_plan_store:
+        viz_agent._plan_store = None
+    if args.batch:
+        return run_batch(args)
+    try:
+        analyze_file(args.data, args)
+    except SourceMismatchError as e:
+        print(f"[main] {e}")
+        return 1
+    return 0
 
-# LLM-driven Insight Generation: pass all outputs as context
-llm_report = insight_agent.generate_insights(
-    exploration_summary,
-    analysis_results,
-    visualizations,
-    relevant_methods,
-    best_practices
-)
 
-# Append full content of knowledge base files to the report (optional, can be removed if only using RAG)
-appendix = "\n\n---\n\n"
-try:
-    with open('knowledge_base/statistical_methods.md', 'r') as f:
-        appendix += "## Appendix: Statistical Methods\n\n" + f.read() + "\n"
-except Exception as e:
-    appendix += f"## Appendix: Statistical Methods\n\nError loading file: {e}\n"
-try:
-    with open('knowledge_base/best_practices.md', 'r') as f:
-        appendix += "\n## Appendix: Best Practices\n\n" + f.read() + "\n"
-except Exception as e:
-    appendix += f"\n## Appendix: Best Practices\n\nError loading file: {e}\n"
-
-final_report = llm_report + appendix
-
-print("\n==== FINAL INSIGHT REPORT ====\n")
-print(final_report)
-
-# Save LLM-generated Markdown report in a separate folder
-os.makedirs('insights', exist_ok=True)
-timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-insight_md_path = os.path.join('insights', f'insight_report_{timestamp}.md')
-with open(insight_md_path, 'w') as f:
-    f.write(final_report)
-print(f"\nInsight report saved to {insight_md_path}\n")
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,403 @@
+"""
+Long-lived analysis service around the pipeline in main.py. Jobs are queued and run on a pool of
+warm worker processes (agents imported, embedding model and knowledge base index loaded, pooled
+UltraSafe client), so a request only pays for its own analysis.
+
+    python server.py --port 8000 --workers 2 [--max-queue 8] [pipeline options from main.py]
+
+    POST /jobs                           CSV body (text/csv) or JSON {"path": "<csv under --data-root>"} -> 202 {"id": ...}
+    GET  /jobs/<id>                      status, timing and artifact names
+    GET  /jobs/<id>/artifacts/<name>     report (.md), plots (plots/*.png) or trace (.trace.json)
+    GET  /health                         queue depth and job counts
+
+When --max-queue jobs are already queued or running, POST /jobs answers 503 with Retry-After.
+Submitting a path is only allowed when the server is started with --data-root, and only for files under it.
+An uploaded input is deleted once its job finishes; finished jobs (records and artifacts) are
+forgotten after --job-ttl seconds or when more than --max-jobs are kept.
+"""
+import contextlib
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty
+
+import main
+from ultrasafe_client.ultrasafe import UltraSafe
+
+UPLOAD_CHUNK = 1 << 20
+# longest wait for a new pool's workers to report warm; later ones still warm up before their first job
+WARM_TIMEOUT = 120
+CONTENT_TYPES = {'.md': 'text/markdown; charset=utf-8', '.png': 'image/png', '.json': 'application/json'}
+
+
+def _init_worker(args, llm_slots, ready):
+    """Pool initializer: warm this worker (main._init_batch_worker) and report it on `ready`."""
+    main._init_batch_worker(args, llm_slots)
+    ready.put(os.getpid())
+
+
+def _noop():
+    return None
+
+
+def _run_job(data_path, job_dir):
+    """Worker side of a job: analyze `data_path` into `job_dir` and return its summary with timings."""
+    started = time.time()
+    UltraSafe.chat.Completions.metrics.reset()
+    summary = main.analyze_file(data_path, main._batch_args, report_dir=job_dir,
+                                plot_dir=os.path.join(job_dir, 'plots'), echo=False)
+    summary['started'] = started
+    summary['worker'] = os.getpid()
+    summary['llm'] = UltraSafe.chat.Completions.metrics.summary()
+    return summary
+
+
+class PathNotAllowed(Exception):
+    pass
+
+
+class JobQueue:
+    """
+    Admits at most `max_queue` unfinished jobs and runs them on a worker pool from `make_pool()`.
+    If a worker dies (e.g. killed for memory) the pool breaks; its jobs fail and a new pool is started.
+    Finished jobs older than `job_ttl` seconds, and the oldest beyond `max_jobs`, are forgotten and
+    their directories deleted; so are directories left in `jobs_dir` by earlier runs once older than `job_ttl`.
+    """
+
+    def __init__(self, make_pool, jobs_dir, max_queue, job_ttl=24 * 3600, max_jobs=1000):
+        self._make_pool = make_pool
+        self.pool = make_pool()
+        self.pool_restarts = 0
+        self.jobs_dir = jobs_dir
+        self.max_queue = max_queue
+        self.job_ttl = job_ttl
+        self.max_jobs = max_jobs
+        self.jobs = {}
+        self._futures = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._pool_lock = threading.Lock()
+        self._remove_stale_dirs(time.time())
+
+    def _remove_stale_dirs(self, now):
+        for entry in os.scandir(self.jobs_dir):
+            if entry.is_dir() and now - entry.stat().st_mtime > self.job_ttl:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def _expire(self, now):
+        """Forget finished jobs past job_ttl, and the oldest beyond max_jobs, deleting their directories."""
+        with self._lock:
+            finished = sorted((j for j in self.jobs.values() if 'finished' in j), key=lambda j: j['finished'])
+            excess = len(finished) - self.max_jobs
+            expired = [j['id'] for i, j in enumerate(finished) if i < excess or now - j['finished'] > self.job_ttl]
+            for job_id in expired:
+                del self.jobs[job_id]
+        for job_id in expired:
+            shutil.rmtree(os.path.join(self.jobs_dir, job_id), ignore_errors=True)
+
+    def reserve(self):
+        """Claim a queue slot and a job directory; returns the job id, or None when the queue is full."""
+        with self._lock:
+            if self._pending >= self.max_queue:
+                return None
+            self._pending += 1
+        job_id = uuid.uuid4().hex[:12]
+        os.makedirs(os.path.join(self.jobs_dir, job_id))
+        return job_id
+
+    def release(self, job_id):
+        """Give back a reserved slot whose job was never submitted."""
+        shutil.rmtree(os.path.join(self.jobs_dir, job_id), ignore_errors=True)
+        with self._lock:
+            self._pending -= 1
+
+    def _replace_pool(self, broken):
+        """Start a new pool in place of `broken` (once, however many of its jobs report it)."""
+        with self._pool_lock:
+            if self.pool is not broken:
+                return
+            print("[server] Worker pool broke; starting a new one")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.pool = self._make_pool()
+            self.pool_restarts += 1
+
+    def submit(self, job_id, data_path):
+        """Queue a reserved job. Raises BrokenProcessPool (after releasing the slot) if no pool can take it."""
+        job = {'id': job_id, 'data': data_path, 'status': 'queued', 'submitted': time.time()}
+        with self._lock:
+            self.jobs[job_id] = job
+        for attempt in range(2):
+            pool = self.pool
+            try:
+                future = pool.submit(_run_job, data_path, os.path.join(self.jobs_dir, job_id))
+                break
+            except BrokenProcessPool as e:
+                error = e
+                self._replace_pool(pool)
+        else:
+            with self._lock:
+                self._pending -= 1
+                job.update(status='error', error=f"BrokenProcessPool: {error}", finished=time.time())
+            raise error
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._finish(job_id, f, pool))
+        return job
+
+    def _finish(self, job_id, future, pool):
+        finished = time.time()
+        with self._lock:
+            job = self.jobs[job_id]
+            self._pending -= 1
+            self._futures.pop(job_id, None)
+            try:
+                summary = future.result()
+            except CancelledError:
+                job.update(status='error', error="CancelledError: the job was cancelled before it ran")
+                started = None
+                broken = False
+            except Exception as e:
+                job.update(status='error', error=f"{type(e).__name__}: {e}")
+                started = None
+                broken = isinstance(e, BrokenProcessPool)
+            else:
+                started = summary.pop('started')
+                job.update(status='done', result=summary)
+                broken = False
+            job['finished'] = finished
+            job['timing'] = {
+                'queue_seconds': round(started - job['submitted'], 3) if started else None,
+                'run_seconds': round(finished - started, 3) if started else None,
+                'total_seconds': round(finished - job['submitted'], 3),
+            }
+        # the upload is only needed while the job runs (a submitted path is not ours to delete)
+        upload = os.path.join(self.jobs_dir, job_id, 'input.csv')
+        if job['data'] == upload:
+            with contextlib.suppress(OSError):
+                os.remove(upload)
+        took = job['timing']['total_seconds']
+        print(f"[server] job {job_id} {job['status']} in {took:.2f}s (queued {job['timing']['queue_seconds']}s)")
+        if broken:
+            self._replace_pool(pool)
+        self._expire(finished)
+
+    def status(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+            future = self._futures.get(job_id)
+        if future is not None and future.running():
+            job['status'] = 'running'
+        job['artifacts'] = self.artifacts(job_id) if job['status'] == 'done' else []
+        return job
+
+    def artifacts(self, job_id):
+        job_dir = os.path.join(self.jobs_dir, job_id)
+        names = []
+        for root, _, files in os.walk(job_dir):
+            names.extend(os.path.relpath(os.path.join(root, f), job_dir).replace(os.sep, '/') for f in files)
+        return sorted(n for n in names if n != 'input.csv' and not n.startswith('.'))
+
+    def health(self):
+        with self._lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return {'pending': self._pending, 'max_queue': self.max_queue, 'jobs': counts,
+                    'pool_restarts': self.pool_restarts}
+
+
+class JobHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    queue = None
+    max_upload = None
+    data_root = None
+    retry_after = 5
+
+    def do_GET(self):
+        parts = self.path.split('?', 1)[0].strip('/').split('/')
+        if parts == ['health']:
+            return self._json(200, self.queue.health())
+        if len(parts) == 2 and parts[0] == 'jobs':
+            job = self.queue.status(parts[1])
+            return self._json(200, job) if job else self._error(404, 'unknown job')
+        if len(parts) >= 4 and parts[0] == 'jobs' and parts[2] == 'artifacts':
+            return self._artifact(parts[1], '/'.join(parts[3:]))
+        self._error(404, 'not found')
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            return self._error(404, 'not found')
+        length = self.headers.get('Content-Length')
+        if length is None:
+            return self._error(411, 'Content-Length required')
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            return self._error(400, 'invalid Content-Length', headers={'Connection': 'close'})
+        if length > self.max_upload:
+            self.close_connection = True
+            return self._error(413, f'upload larger than {self.max_upload} bytes', headers={'Connection': 'close'})
+        job_id = self.queue.reserve()
+        if job_id is None:
+            # don't read an upload we are rejecting; drop the connection after answering instead
+            self.close_connection = True
+            return self._error(503, 'job queue is full',
+                               headers={'Retry-After': str(self.retry_after), 'Connection': 'close'})
+        try:
+            data_path = self._read_input(job_id, length)
+        except PathNotAllowed as e:
+            self.queue.release(job_id)
+            return self._error(403, str(e))
+        except Exception as e:
+            # any bad input gives the slot back; a leaked slot would eventually make /jobs answer 503 for good
+            self.queue.release(job_id)
+            return self._error(400, str(e))
+        try:
+            job = self.queue.submit(job_id, data_path)
+        except BrokenProcessPool:
+            return self._error(503, 'worker pool unavailable', headers={'Retry-After': str(self.retry_after)})
+        self._json(202, {'id': job_id, 'status': job['status'], 'status_url': f'/jobs/{job_id}'})
+
+    def _read_input(self, job_id, length):
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            body = json.loads(self.rfile.read(length))
+            if not isinstance(body, dict):
+                raise ValueError('expected a JSON object {"path": ...}')
+            return self._allowed_path(body.get('path'))
+        data_path = os.path.join(self.queue.jobs_dir, job_id, 'input.csv')
+        with open(data_path, 'wb') as f:
+            remaining = length
+            while remaining:
+                chunk = self.rfile.read(min(UPLOAD_CHUNK, remaining))
+                if not chunk:
+                    raise ValueError('upload ended early')
+                f.write(chunk)
+                remaining -= len(chunk)
+        return data_path
+
+    def _allowed_path(self, path):
+        """`path` resolved, if it is a file under --data-root (symlinks resolved first)."""
+        if self.data_root is None:
+            raise PathNotAllowed('path submission is disabled (start the server with --data-root); upload the CSV instead')
+        if not isinstance(path, str) or not path:
+            raise ValueError('"path" must be a non-empty string')
+        resolved = os.path.realpath(os.path.join(self.data_root, path))
+        if os.path.commonpath([resolved, self.data_root]) != self.data_root:
+            raise PathNotAllowed(f'{path} is outside the data root')
+        if not os.path.isfile(resolved):
+            raise ValueError(f'no such CSV file: {path}')
+        return resolved
+
+    def _artifact(self, job_id, name):
+        job = self.queue.status(job_id)
+        if job is None or name not in job['artifacts']:
+            return self._error(404, 'unknown artifact')
+        path = os.path.join(self.queue.jobs_dir, job_id, *name.split('/'))
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPES.get(os.path.splitext(name)[1], 'application/octet-stream'))
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def _json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message, headers=None):
+        self._json(status, {'error': message}, headers)
+
+    def log_message(self, *args):
+        pass
+
+
+def build_parser():
+    parser = main.build_parser()
+    parser.description = "Serve the analysis pipeline over HTTP with a job queue and warm worker processes."
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-queue", type=int, default=None,
+                        help="jobs queued or running before new submissions get 503 (default: 4 per worker)")
+    parser.add_argument("--jobs-dir", default="jobs", help="where job inputs and artifacts are kept")
+    parser.add_argument("--max-upload-mb", type=int, default=1024)
+    parser.add_argument("--job-ttl", type=float, default=24 * 3600,
+                        help="seconds a finished job's status and artifacts are kept (default: one day)")
+    parser.add_argument("--max-jobs", type=int, default=1000,
+                        help="finished jobs kept at most; the oldest are deleted first")
+    parser.add_argument("--data-root", default=None,
+                        help="allow JSON {\"path\": ...} submissions of CSVs under this directory "
+                             "(relative paths are resolved against it); without it only uploads are accepted")
+    return parser
+
+
+def serve():
+    args = build_parser().parse_args()
+    if args.incremental or args.batch:
+        print("--incremental and --batch are not supported in server mode")
+        return 2
+    workers = args.workers or os.cpu_count() or 1
+    os.makedirs(args.jobs_dir, exist_ok=True)
+    # the HTTP server is multi-threaded, so workers are spawned rather than forked from it
+    ctx = multiprocessing.get_context('spawn')
+    llm_slots = ctx.BoundedSemaphore(args.max_llm_concurrency)
+
+    def make_pool():
+        start = time.perf_counter()
+        ready = ctx.Queue()
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                   initargs=(args, llm_slots, ready))
+        # workers are started on demand; one task each gets them all started, and every worker
+        # reports from the initializer once warm, whichever tasks it ends up running
+        for _ in range(workers):
+            pool.submit(_noop)
+        warmed = set()
+        try:
+            while len(warmed) < workers:
+                warmed.add(ready.get(timeout=WARM_TIMEOUT))
+        except Empty:
+            pass
+        print(f"[server] {len(warmed)} of {workers} workers warm after {time.perf_counter() - start:.1f}s")
+        return pool
+
+    queue = JobHandler.queue = JobQueue(make_pool, os.path.abspath(args.jobs_dir), args.max_queue or 4 * workers,
+                                        job_ttl=args.job_ttl, max_jobs=args.max_jobs)
+    JobHandler.max_upload = args.max_upload_mb << 20
+    JobHandler.data_root = os.path.realpath(args.data_root) if args.data_root else None
+    httpd = ThreadingHTTPServer((args.host, args.port), JobHandler)
+    print(f"[server] Listening on http://{args.host}:{httpd.server_address[1]}/ "
+          f"(queue limit {queue.max_queue}, {args.max_llm_concurrency} concurrent LLM calls)")
+    # SIGTERM shuts down like Ctrl-C so the worker processes are stopped too
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("[server] Shutting down")
+    finally:
+        httpd.server_close()
+        queue.pool.shutdown(cancel_futures=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(serve())
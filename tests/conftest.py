@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class FakeLLM:
+    """
+    A local chat completions endpoint that answers every request with `content`, as JSON or, for
+    stream=True, as server-sent events written raw in UTF-8 (no ASCII escaping, no charset).
+    """
+
+    def __init__(self):
+        self.content = "ok"
+        self.content_type = "text/event-stream"
+        self.delay = 0.0
+        self.calls = 0
+        self._lock = threading.Lock()
+        handler = type("Handler", (_Handler,), {"llm": self})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    llm = None
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.llm._lock:
+            self.llm.calls += 1
+        time.sleep(self.llm.delay)
+        if body.get("stream"):
+            self._stream(self.llm.content)
+        else:
+            out = json.dumps({"choices": [{"message": {"role": "assistant", "content": self.llm.content}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+    def _stream(self, content):
+        self.send_response(200)
+        self.send_header("Content-Type", self.llm.content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        events = [f"data: {json.dumps({'choices': [{'delta': {'content': content[i:i + 5]}}]}, ensure_ascii=False)}\n\n"
+                  for i in range(0, len(content), 5)] + ["data: [DONE]\n\n"]
+        for event in events:
+            chunk = event.encode("utf-8")
+            # split every event mid-way so multi-byte characters straddle chunk boundaries
+            for part in (chunk[:len(chunk) // 2], chunk[len(chunk) // 2:]):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(part), part))
+                self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """A FakeLLM that the UltraSafe client talks to, with the client's response cache disabled."""
+    from ultrasafe_client import ultrasafe
+
+    llm = FakeLLM()
+    monkeypatch.setenv("ULTRASAFE_API_KEY", "test")
+    monkeypatch.setattr(ultrasafe, "API_URL", llm.url)
+    completions = ultrasafe.UltraSafe.chat.Completions
+    completions.configure_cache(None)
+    monkeypatch.setattr(completions, "limiter", None)
+    monkeypatch.setattr(completions, "max_retries", 0)
+    yield llm
+    completions.configure_cache(None)
+    llm.close()
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from agents.incremental import IncrementalState, SourceMismatchError
+
+HEADER = "﻿IDENT,PROBLEM,ACTION\n"
+
+
+def _rows(start, stop):
+    return "".join(f'{i},"ENGINE ROUGH, NO {i % 3}",REPLACED PLUG\n' for i in range(start, stop))
+
+
+def _write(path, text, mode="w"):
+    with open(path, mode, encoding="utf-8") as f:
+        f.write(text)
+
+
+def _fold(state_path, data_path):
+    state = IncrementalState.load(str(state_path))
+    new_rows = state.fold_csv(str(data_path), chunksize=7)
+    state.save()
+    return state, new_rows
+
+
+def test_appended_rows_are_read_from_the_saved_offset(tmp_path):
+    data, state_path = tmp_path / "log.csv", tmp_path / "state.json"
+    _write(data, HEADER + _rows(1, 21))
+    state, new_rows = _fold(state_path, data)
+    assert new_rows == 20 and state.source["resumed_from"] == 0
+    offset = state.source["offset"]
+    assert offset == os.path.getsize(data)
+
+    _write(data, _rows(21, 26), mode="a")
+    state, new_rows = _fold(state_path, data)
+    assert new_rows == 5
+    assert state.source["resumed_from"] == offset
+    assert state.source["rows"] == 25
+    assert state.profile.n_rows == 25 and state.last_ident == 25
+    assert list(state.profile.data.columns) == ["IDENT", "PROBLEM", "ACTION"]
+
+    state, new_rows = _fold(state_path, data)
+    assert new_rows == 0 and state.profile.n_rows == 25
+
+
+@pytest.mark.parametrize("rewrite", [
+    lambda data: _write(data, HEADER + _rows(1, 4)),                              # shrank
+    lambda data: _write(data, HEADER + "1,OIL LEAK,TIGHTENED\n" + _rows(2, 31)),     # head changed
+])
+def test_rewritten_file_falls_back_to_the_ident_filter(tmp_path, rewrite):
+    data, state_path = tmp_path / "log.csv", tmp_path / "state.json"
+    _write(data, HEADER + _rows(1, 21))
+    _fold(state_path, data)
+    rewrite(data)
+    state, new_rows = _fold(state_path, data)
+    assert state.source["resumed_from"] == 0
+    assert new_rows == max(0, state.source["rows"] - 20)
+
+
+def test_state_is_tied_to_its_data_file(tmp_path):
+    data, other, state_path = tmp_path / "log.csv", tmp_path / "other.csv", tmp_path / "state.json"
+    _write(data, HEADER + _rows(1, 11))
+    _write(other, HEADER + _rows(1, 11))
+    _fold(state_path, data)
+    with pytest.raises(SourceMismatchError):
+        _fold(state_path, other)
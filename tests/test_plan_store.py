@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from agents.plan_store import MAX_PLOTS, PlanStore, PlanValidationError, parse_plan, validate_plan
+
+COLUMNS = ['IDENT', 'PROBLEM', 'ACTION', 'HOURS']
+BAR = {'plot_type': 'bar', 'columns': ['PROBLEM'], 'description': 'Most frequent problems'}
+
+
+@pytest.mark.parametrize('plan', [[BAR], {'plots': BAR}, {'plots': [BAR], 'extra': 1}, {}, 'plots'])
+def test_malformed_envelope_is_rejected(plan):
+    with pytest.raises(PlanValidationError):
+        validate_plan(plan, COLUMNS)
+
+
+def test_invalid_instructions_are_dropped():
+    plots = [
+        BAR,
+        {'plot_type': 'violin', 'columns': ['HOURS'], 'description': 'd'},           # unknown type
+        {'plot_type': 'scatter', 'columns': ['HOURS'], 'description': 'd'},          # wrong arity
+        {'plot_type': 'heatmap', 'columns': ['HOURS'], 'description': 'd'},          # heatmap is ["missing"]
+        {'plot_type': 'pie', 'columns': ['ACTION'], 'description': 'd', 'x': 1},     # extra key
+        {'plot_type': 'pie', 'columns': ['ACTION']},                                 # missing description
+        {'plot_type': 'histogram', 'columns': [3], 'description': 'd'},              # non-string column
+        {'plot_type': 'histogram', 'columns': ['NOPE'], 'description': 'd'},         # unknown column
+        {'plot_type': 'heatmap', 'columns': ['missing'], 'description': 'd', 'rationale': 'r'},
+    ]
+    plan = validate_plan({'plots': plots}, COLUMNS)
+    assert plan == [BAR]
+    plan = validate_plan({'plots': [BAR, plots[-1]]}, COLUMNS)
+    assert [p['plot_type'] for p in plan] == ['bar', 'heatmap']
+
+
+def test_only_the_first_max_plots_are_kept():
+    plan = parse_plan(json.dumps({'plots': [BAR] * (MAX_PLOTS + 3)}), COLUMNS)
+    assert len(plan) == MAX_PLOTS
+
+
+def test_non_json_answer_is_rejected():
+    with pytest.raises(PlanValidationError):
+        parse_plan('plots: bar', COLUMNS)
+
+
+def test_store_expires_and_evicts(tmp_path):
+    store = PlanStore(str(tmp_path / 'plans.sqlite'), ttl=3600, max_entries=2)
+    for key in ('a', 'b', 'c'):
+        store.put(key, [BAR])
+    assert store.stats()['size'] == 2 and store.get('a', COLUMNS) is None
+    assert store.get('c', COLUMNS) == [BAR]
+    # a stored plan naming a column the dataset does not have is a miss
+    assert store.get('c', ['IDENT']) is None
+    store.ttl = 0
+    assert store.get('c', COLUMNS) is None and store.stats()['size'] == 1
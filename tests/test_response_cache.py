@@ -0,0 +1,72 @@
+import asyncio
+import threading
+import time
+
+from ultrasafe_client.ultrasafe import UltraSafe
+
+Completions = UltraSafe.chat.Completions
+
+
+def _ask(prompt="hi"):
+    return Completions.create("usf1-mini", [{"role": "user", "content": prompt}], temperature=0.0)
+
+
+def test_cache_hit_skips_the_upstream_call(fake_llm, tmp_path):
+    cache = Completions.configure_cache(str(tmp_path / "cache.sqlite"))
+    first = _ask()
+    assert _ask() == first
+    assert fake_llm.calls == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_expired_entries_are_fetched_again(fake_llm, tmp_path):
+    Completions.configure_cache(str(tmp_path / "cache.sqlite"), ttl=0.2)
+    _ask()
+    _ask()
+    assert fake_llm.calls == 1
+    time.sleep(0.3)
+    _ask()
+    assert fake_llm.calls == 2
+
+
+def test_least_recently_used_entry_is_evicted(fake_llm, tmp_path):
+    cache = Completions.configure_cache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    for prompt in ("a", "b", "a", "c"):  # "a" is read again before "c" is stored, so "b" goes
+        _ask(prompt)
+        time.sleep(0.01)
+    assert fake_llm.calls == 3 and cache.stats()["size"] == 2
+    _ask("a")
+    _ask("c")
+    assert fake_llm.calls == 3
+    _ask("b")
+    assert fake_llm.calls == 4
+
+
+def test_concurrent_identical_requests_share_one_call(fake_llm, tmp_path):
+    Completions.configure_cache(str(tmp_path / "cache.sqlite"))
+    fake_llm.delay = 0.3
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(_ask())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 8 and all(r == results[0] for r in results)
+    assert fake_llm.calls == 1
+
+
+def test_concurrent_identical_async_requests_share_one_call(fake_llm, tmp_path):
+    Completions.configure_cache(str(tmp_path / "cache.sqlite"))
+    fake_llm.delay = 0.3
+
+    async def run():
+        try:
+            return await asyncio.gather(*[
+                Completions.acreate("usf1-mini", [{"role": "user", "content": "hi"}], temperature=0.0)
+                for _ in range(8)])
+        finally:
+            await Completions.aclose()
+
+    results = asyncio.run(run())
+    assert all(r == results[0] for r in results)
+    assert fake_llm.calls == 1
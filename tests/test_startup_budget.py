@@ -0,0 +1,13 @@
+import statistics
+
+from agents.startup_profile import AGENT_MODULES, STARTUP_BUDGET, format_report, profile_imports
+
+
+def test_agent_modules_import_within_budget():
+    # median of a few fresh interpreters, so one slow run (cold disk cache) does not fail the suite
+    runs = [profile_imports(AGENT_MODULES) for _ in range(3)]
+    median = statistics.median(wall for _, wall in runs)
+    records, _ = min(runs, key=lambda run: abs(run[1] - median))
+    assert median <= STARTUP_BUDGET, (
+        f"cold import of the agent modules took {median:.3f}s (budget {STARTUP_BUDGET:.3f}s)\n"
+        + format_report(records, median))
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from ultrasafe_client.ultrasafe import UltraSafe, UltraSafeAPIError, _sse_event
+
+# curly quote, em dash, accents, a Unicode line separator and an astral-plane character
+TEXT = "Welch’s test — café naïve   \U0001F4CA done"
+
+
+def _create(stream=True):
+    return UltraSafe.chat.Completions.create("usf1-mini", [{"role": "user", "content": "hi"}], stream=stream)
+
+
+def test_sync_stream_keeps_non_ascii_deltas(fake_llm):
+    fake_llm.content = TEXT
+    assert "".join(_create()) == TEXT
+
+
+def test_async_stream_keeps_non_ascii_deltas(fake_llm):
+    fake_llm.content = TEXT
+
+    async def run():
+        try:
+            stream = await UltraSafe.chat.Completions.acreate("usf1-mini", [{"role": "user", "content": "hi"}], stream=True)
+            return "".join([delta async for delta in stream])
+        finally:
+            await UltraSafe.chat.Completions.aclose()
+
+    assert asyncio.run(run()) == TEXT
+
+
+def test_stream_with_non_text_content_type(fake_llm):
+    fake_llm.content = TEXT
+    fake_llm.content_type = "application/octet-stream"
+    assert "".join(_create()) == TEXT
+
+
+def test_cached_stream_is_not_mangled(fake_llm, tmp_path):
+    fake_llm.content = TEXT
+    UltraSafe.chat.Completions.configure_cache(str(tmp_path / "cache.sqlite"))
+    assert "".join(_create()) == TEXT
+    assert _create(stream=False)["choices"][0]["message"]["content"] == TEXT
+    assert fake_llm.calls == 1
+
+
+@pytest.mark.parametrize("line", ['data: 5', 'data: {"choices": "x"}', b'data: {"choices": [1]}', 'data: [}'])
+def test_malformed_stream_event(line):
+    with pytest.raises(UltraSafeAPIError):
+        _sse_event(line)
@@ -1,28 +1,294 @@
+import asyncio
+import contextlib
+import json
 import os
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from ultrasafe_client.response_cache import ResponseCache
 
 load_dotenv()
 
+API_URL = os.getenv("ULTRASAFE_API_URL", "https://api.us.inc/usf/v1/hiring/chat/completions")
+CONNECT_TIMEOUT = float(os.getenv("ULTRASAFE_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.getenv("ULTRASAFE_READ_TIMEOUT", 120))
+MAX_RETRIES = int(os.getenv("ULTRASAFE_MAX_RETRIES", 4))
+POOL_SIZE = int(os.getenv("ULTRASAFE_POOL_SIZE", 10))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+# longest Retry-After honoured; a retry slot (and, in batch mode, an LLM semaphore slot) is held while waiting
+RETRY_AFTER_MAX = float(os.getenv("ULTRASAFE_RETRY_AFTER_MAX", 60))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UltraSafeAPIError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class ClientMetrics:
+    """Per-call latency/retry records plus running totals for the UltraSafe client."""
+
+    def __init__(self, maxlen=1000):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.records = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def record(self, latency, retries, status, ok):
+        with self._lock:
+            self.calls += 1
+            self.retries += retries
+            if not ok:
+                self.errors += 1
+            self.records.append({"latency": latency, "retries": retries, "status": status, "ok": ok})
+
+    def summary(self):
+        with self._lock:
+            latencies = sorted(r["latency"] for r in self.records)
+            summary = {"calls": self.calls, "errors": self.errors, "retries": self.retries}
+        if latencies:
+            summary.update({
+                "latency_mean": sum(latencies) / len(latencies),
+                "latency_p50": latencies[len(latencies) // 2],
+                "latency_p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                "latency_max": latencies[-1],
+            })
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self.calls = self.errors = self.retries = 0
+            self.records.clear()
+
+
+def _retry_after(response):
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _backoff(attempt, response=None):
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After (capped at RETRY_AFTER_MAX)."""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    return max(delay, min(_retry_after(response), RETRY_AFTER_MAX))
+
+
+_SSE_DONE = object()
+
+
+def _sse_event(line):
+    """
+    Parse one server-sent-event line (str, or raw bytes decoded as UTF-8 as the SSE spec requires):
+    returns a content delta, _SSE_DONE, or None.
+    """
+    if isinstance(line, bytes):
+        line = line.decode("utf-8", errors="replace")
+    if not line or not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return _SSE_DONE
+    try:
+        choice = json.loads(data)["choices"][0]
+        return (choice.get("delta") or {}).get("content") or None
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+        raise UltraSafeAPIError(f"Unexpected stream event: {data[:200]}") from e
+
+
+async def _aiter_raw_lines(response):
+    """
+    Lines of a streamed httpx response as bytes, split on newlines only (aiter_lines() would also
+    split on Unicode line separators, which may appear unescaped inside a JSON event).
+    """
+    buffer = b""
+    async for chunk in response.aiter_bytes():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r")
+    if buffer:
+        yield buffer.rstrip(b"\r")
+
+
+def _sse_deltas(lines):
+    """Yield the content deltas from an iterable of server-sent-event lines."""
+    for line in lines:
+        event = _sse_event(line)
+        if event is _SSE_DONE:
+            return
+        if event:
+            yield event
+
+
+def _token_counts(payload, response_data=None, completion_text=None):
+    """Prompt/completion token counts from the API's `usage`, else estimated at ~4 characters per token."""
+    usage = (response_data or {}).get("usage") or {}
+    if "prompt_tokens" in usage:
+        return {"prompt_tokens": usage.get("prompt_tokens"), "completion_tokens": usage.get("completion_tokens")}
+    if completion_text is None and response_data:
+        try:
+            completion_text = response_data["choices"][0]["message"]["content"] or ""
+        except (KeyError, IndexError, TypeError):
+            completion_text = ""
+    prompt_chars = sum(len(str(m.get("content", ""))) for m in payload["messages"])
+    return {"prompt_tokens": (prompt_chars + 3) // 4, "completion_tokens": (len(completion_text or "") + 3) // 4,
+            "tokens_estimated": True}
+
+
+def _completion(content):
+    """A streamed completion in the shape of a non-streamed response, for the response cache."""
+    return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+
+def _replay(response):
+    """A cached response as a stream of one content delta."""
+    content = response["choices"][0]["message"]["content"]
+    if content:
+        yield content
+
+
+async def _areplay(response):
+    for delta in _replay(response):
+        yield delta
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
 
 class UltraSafe:
     class Chat:
         class Completions:
+            cache = None
+            metrics = ClientMetrics()
+            timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+            max_retries = MAX_RETRIES
+            pool_size = POOL_SIZE
+            _session = None
+            _session_lock = threading.Lock()
+            _inflight = {}
+            _inflight_lock = threading.Lock()
+            _async_clients = {}
+            _ainflight = {}
+            limiter = None
+            # span(name, category, **attrs) context manager installed by agents.tracing.enable()
+            trace_span = None
+
             def __init__(self):
 
                 self.api_key = os.getenv("ULTRASAFE_API_KEY")
                 if not self.api_key:
                     raise ValueError("ULTRASAFE_API_KEY environment variable not set.")
-            @staticmethod
-            def create(model, messages, temperature=0.7, max_tokens=1000, web_search=True, stream=False):
+
+            @classmethod
+            def configure_cache(cls, path=None, ttl=7 * 24 * 3600, max_entries=1000):
                 """
-                Mimics the OpenAI API's chat.completions.create method.
-                Sends a request to the UltraSafe API and returns the response.
+                Enable the on-disk response cache at `path` (SQLite), or disable it when `path` is None.
+                """
+                if cls.cache is not None:
+                    cls.cache.close()
+                cls.cache = ResponseCache(path, ttl=ttl, max_entries=max_entries) if path else None
+                return cls.cache
+
+            @classmethod
+            def configure_http(cls, connect_timeout=None, read_timeout=None, max_retries=None, pool_size=None):
                 """
-                api_url = "https://api.us.inc/usf/v1/hiring/chat/completions"  
+                Adjust timeouts (seconds), retry budget and connection pool size for subsequent calls.
+                """
+                connect, read = cls.timeout
+                cls.timeout = (connect_timeout or connect, read_timeout or read)
+                if max_retries is not None:
+                    cls.max_retries = max_retries
+                if pool_size is not None and pool_size != cls.pool_size:
+                    cls.pool_size = pool_size
+                    with cls._session_lock:
+                        if cls._session is not None:
+                            cls._session.close()
+                        cls._session = None
+
+            @classmethod
+            def configure_concurrency(cls, limit=None):
+                """
+                Cap the number of LLM requests in flight. `limit` is a slot count (per process), a
+                semaphore-like object with acquire()/release() (e.g. a multiprocessing.BoundedSemaphore
+                shared by worker processes), or None for no limit.
+                """
+                cls.limiter = threading.BoundedSemaphore(limit) if isinstance(limit, int) else limit
+                return cls.limiter
+
+            @classmethod
+            @contextlib.contextmanager
+            def _slot(cls):
+                limiter = cls.limiter
+                if limiter is None:
+                    yield
+                    return
+                limiter.acquire()
+                try:
+                    yield
+                finally:
+                    limiter.release()
+
+            @classmethod
+            @contextlib.asynccontextmanager
+            async def _aslot(cls):
+                limiter = cls.limiter
+                if limiter is None:
+                    yield
+                    return
+                # the limiter may be a cross-process semaphore, so block on it in a thread
+                acquire = asyncio.ensure_future(asyncio.to_thread(limiter.acquire))
+                try:
+                    await asyncio.shield(acquire)
+                except asyncio.CancelledError:
+                    acquire.add_done_callback(lambda f: f.cancelled() or f.exception() or limiter.release())
+                    raise
+                try:
+                    yield
+                finally:
+                    limiter.release()
+
+            @classmethod
+            def _span(cls, name, payload):
+                if cls.trace_span is None:
+                    return contextlib.nullcontext(None)
+                return cls.trace_span(name, "llm", model=payload["model"], max_tokens=payload["max_tokens"])
+
+            @classmethod
+            def _get_session(cls):
+                with cls._session_lock:
+                    if cls._session is None:
+                        session = requests.Session()
+                        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=cls.pool_size, max_retries=0)
+                        session.mount("https://", adapter)
+                        session.mount("http://", adapter)
+                        cls._session = session
+                    return cls._session
+
+            @staticmethod
+            def _build_request(model, messages, temperature, max_tokens, web_search, stream, response_format=None):
                 headers = {
                     "Content-Type": "application/json",
-                    "Authorization": f"Bearer {os.getenv('ULTRASAFE_API_KEY')}",  
+                    "Authorization": f"Bearer {os.getenv('ULTRASAFE_API_KEY')}",
                 }
                 payload = {
                     "model": model,
@@ -32,18 +298,275 @@ class UltraSafe:
                     "stream": stream,
                     "max_tokens": max_tokens
                 }
+                if response_format is not None:
+                    payload["response_format"] = response_format
+                return headers, payload
 
+            @classmethod
+            def create(cls, model, messages, temperature=0.7, max_tokens=1000, web_search=True, stream=False, use_cache=True,
+                        response_format=None):
+                """
+                Mimics the OpenAI API's chat.completions.create method.
+                Sends a request to the UltraSafe API and returns the response.
+                Connections are pooled; timeouts, 429s and 5xx responses are retried with jittered
+                exponential backoff, and UltraSafeAPIError is raised once the retry budget is spent.
+                When a response cache is configured, identical requests are answered from it and
+                concurrent identical requests share a single upstream call.
+                With stream=True, returns a generator of content deltas parsed from the SSE stream; a
+                completed stream is cached like any other response and a cache hit is replayed as a
+                single delta. `response_format` (e.g. {"type": "json_object"})
+                is passed through to request structured output.
+                """
+                headers, payload = cls._build_request(model, messages, temperature, max_tokens, web_search, stream, response_format)
+                cache = cls.cache
+                if cache is None or not use_cache:
+                    return cls._stream(headers, payload) if stream else cls._post(headers, payload)
+
+                key = ResponseCache.make_key(model, messages, temperature, max_tokens, response_format)
+                cached = cache.get(key)
+                if stream:
+                    return _replay(cached) if cached is not None else cls._stream(headers, payload, key)
+                if cached is not None:
+                    return cached
+                with cls._inflight_lock:
+                    pending = cls._inflight.get(key)
+                    leader = pending is None
+                    if leader:
+                        pending = cls._inflight[key] = _InFlight()
+                if not leader:
+                    pending.done.wait()
+                    if pending.error is not None:
+                        raise pending.error
+                    return pending.result
                 try:
-                    response = requests.post(api_url, headers=headers, json=payload)
-                    response.raise_for_status() 
-                    response_data = response.json()
-                    
+                    pending.result = cls._post(headers, payload)
+                    cache.set(key, pending.result)
+                except Exception as e:
+                    pending.error = e
+                    raise
+                finally:
+                    with cls._inflight_lock:
+                        del cls._inflight[key]
+                    pending.done.set()
+                return pending.result
+
+            @classmethod
+            def _send(cls, headers, payload, start, stream=False):
+                """
+                POST `payload`, retrying retryable failures. Returns (response, retries) once the
+                server answers with a non-retryable status; raises UltraSafeAPIError when out of retries.
+                """
+                session = cls._get_session()
+                status = None
+                attempt = 0
+                while True:
+                    response = None
+                    try:
+                        response = session.post(API_URL, headers=headers, json=payload, timeout=cls.timeout, stream=stream)
+                        status = response.status_code
+                        if status not in RETRY_STATUSES:
+                            return response, attempt
+                        error = UltraSafeAPIError(f"API returned HTTP {status}", status)
+                    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                        error = UltraSafeAPIError(f"API Request Error: {e}", status)
+                    except requests.exceptions.RequestException as e:
+                        cls.metrics.record(time.perf_counter() - start, attempt, status, False)
+                        raise UltraSafeAPIError(f"API Request Error: {e}", status) from e
+                    if attempt >= cls.max_retries:
+                        cls.metrics.record(time.perf_counter() - start, attempt, status, False)
+                        raise error
+                    delay = _backoff(attempt, response)
+                    print(f"[UltraSafe] {error}; retrying in {delay:.1f}s ({attempt + 1}/{cls.max_retries})")
+                    if response is not None:
+                        response.close()
+                    time.sleep(delay)
+                    attempt += 1
+
+            @classmethod
+            def _post(cls, headers, payload):
+                with cls._slot(), cls._span("llm.request", payload) as span:
+                    start = time.perf_counter()
+                    response, retries = cls._send(headers, payload, start)
+                    try:
+                        response.raise_for_status()
+                        response_data = response.json()
+                    except (requests.exceptions.RequestException, ValueError) as e:
+                        cls.metrics.record(time.perf_counter() - start, retries, response.status_code, False)
+                        raise UltraSafeAPIError(f"API Request Error: {e}", response.status_code) from e
+                    cls.metrics.record(time.perf_counter() - start, retries, response.status_code, True)
+                    if span is not None:
+                        span.set(retries=retries, **_token_counts(payload, response_data))
                     return response_data
-                except requests.exceptions.RequestException as e:
-                    print(f"API Request Error: {e}")
-                    return None
-                except KeyError as e:
-                    print(f"Unexpected API Response Format: {e}")
-                    return None
-
-    chat = Chat()
\ No newline at end of file
+
+            @classmethod
+            def _stream(cls, headers, payload, cache_key=None):
+                with cls._slot(), cls._span("llm.stream", payload) as span:
+                    start = time.perf_counter()
+                    response, retries = cls._send(headers, payload, start, stream=True)
+                    ok = False
+                    received = []
+                    try:
+                        response.raise_for_status()
+                        # raw lines, decoded by _sse_event: requests would decode a charset-less
+                        # text/event-stream as ISO-8859-1 and split lines on Unicode separators
+                        for delta in _sse_deltas(response.iter_lines()):
+                            received.append(delta)
+                            yield delta
+                        ok = True
+                        if cache_key is not None:
+                            cls.cache.set(cache_key, _completion("".join(received)))
+                    except requests.exceptions.RequestException as e:
+                        raise UltraSafeAPIError(f"API Stream Error: {e}", response.status_code) from e
+                    finally:
+                        response.close()
+                        cls.metrics.record(time.perf_counter() - start, retries, response.status_code, ok)
+                        if span is not None:
+                            span.set(retries=retries, **_token_counts(payload, completion_text="".join(received)))
+
+            @classmethod
+            async def acreate(cls, model, messages, temperature=0.7, max_tokens=1000, web_search=True, stream=False, use_cache=True,
+                              response_format=None):
+                """
+                Async variant of create() built on a pooled httpx.AsyncClient (one per event loop).
+                Shares the response cache, retry policy and metrics with the sync client.
+                With stream=True, returns an async generator of content deltas.
+                """
+                headers, payload = cls._build_request(model, messages, temperature, max_tokens, web_search, stream, response_format)
+                cache = cls.cache
+                if cache is None or not use_cache:
+                    return cls._astream(headers, payload) if stream else await cls._apost(headers, payload)
+
+                key = ResponseCache.make_key(model, messages, temperature, max_tokens, response_format)
+                cached = cache.get(key)
+                if stream:
+                    return _areplay(cached) if cached is not None else cls._astream(headers, payload, key)
+                if cached is not None:
+                    return cached
+                inflight_key = (id(asyncio.get_running_loop()), key)
+                pending = cls._ainflight.get(inflight_key)
+                if pending is not None:
+                    return await asyncio.shield(pending)
+                pending = cls._ainflight[inflight_key] = asyncio.get_running_loop().create_future()
+                try:
+                    result = await cls._apost(headers, payload)
+                    cache.set(key, result)
+                    pending.set_result(result)
+                except asyncio.CancelledError:
+                    pending.cancel()
+                    raise
+                except Exception as e:
+                    pending.set_exception(e)
+                    raise
+                finally:
+                    del cls._ainflight[inflight_key]
+                    if not pending.cancelled():
+                        pending.exception()
+                return result
+
+            @classmethod
+            def _get_async_client(cls):
+                import httpx
+                loop = asyncio.get_running_loop()
+                client = cls._async_clients.get(loop)
+                if client is None or client.is_closed:
+                    connect, read = cls.timeout
+                    client = cls._async_clients[loop] = httpx.AsyncClient(
+                        timeout=httpx.Timeout(read, connect=connect),
+                        limits=httpx.Limits(max_connections=cls.pool_size, max_keepalive_connections=cls.pool_size),
+                    )
+                return client
+
+            @classmethod
+            async def aclose(cls):
+                client = cls._async_clients.pop(asyncio.get_running_loop(), None)
+                if client is not None:
+                    await client.aclose()
+
+            @classmethod
+            async def _asend(cls, headers, payload, start, stream=False):
+                import httpx
+                client = cls._get_async_client()
+                status = None
+                attempt = 0
+                while True:
+                    response = None
+                    try:
+                        request = client.build_request("POST", API_URL, headers=headers, json=payload)
+                        response = await client.send(request, stream=stream)
+                        status = response.status_code
+                        if status not in RETRY_STATUSES:
+                            return response, attempt
+                        error = UltraSafeAPIError(f"API returned HTTP {status}", status)
+                        await response.aclose()
+                    except (httpx.TimeoutException, httpx.TransportError) as e:
+                        error = UltraSafeAPIError(f"API Request Error: {e!r}", status)
+                    except httpx.HTTPError as e:
+                        cls.metrics.record(time.perf_counter() - start, attempt, status, False)
+                        raise UltraSafeAPIError(f"API Request Error: {e}", status) from e
+                    if attempt >= cls.max_retries:
+                        cls.metrics.record(time.perf_counter() - start, attempt, status, False)
+                        raise error
+                    delay = _backoff(attempt, response)
+                    print(f"[UltraSafe] {error}; retrying in {delay:.1f}s ({attempt + 1}/{cls.max_retries})")
+                    await asyncio.sleep(delay)
+                    attempt += 1
+
+            @classmethod
+            async def _apost(cls, headers, payload):
+                import httpx
+                async with cls._aslot():
+                    with cls._span("llm.request", payload) as span:
+                        start = time.perf_counter()
+                        response, retries = await cls._asend(headers, payload, start)
+                        try:
+                            response.raise_for_status()
+                            response_data = response.json()
+                        except (httpx.HTTPError, ValueError) as e:
+                            cls.metrics.record(time.perf_counter() - start, retries, response.status_code, False)
+                            raise UltraSafeAPIError(f"API Request Error: {e}", response.status_code) from e
+                        cls.metrics.record(time.perf_counter() - start, retries, response.status_code, True)
+                        if span is not None:
+                            span.set(retries=retries, **_token_counts(payload, response_data))
+                        return response_data
+
+            @classmethod
+            async def _astream(cls, headers, payload, cache_key=None):
+                import httpx
+                async with cls._aslot():
+                    with cls._span("llm.stream", payload) as span:
+                        start = time.perf_counter()
+                        response, retries = await cls._asend(headers, payload, start, stream=True)
+                        ok = False
+                        received = []
+                        try:
+                            response.raise_for_status()
+                            async for line in _aiter_raw_lines(response):
+                                event = _sse_event(line)
+                                if event is _SSE_DONE:
+                                    break
+                                if event:
+                                    received.append(event)
+                                    yield event
+                            ok = True
+                            if cache_key is not None:
+                                cls.cache.set(cache_key, _completion("".join(received)))
+                        except httpx.HTTPError as e:
+                            raise UltraSafeAPIError(f"API Stream Error: {e}", response.status_code) from e
+                        finally:
+                            await response.aclose()
+                            cls.metrics.record(time.perf_counter() - start, retries, response.status_code, ok)
+                            if span is not None:
+                                span.set(retries=retries, **_token_counts(payload, completion_text="".join(received)))
+
+    chat = Chat()
+
+
+if os.getenv("ULTRASAFE_CACHE_PATH"):
+    UltraSafe.chat.Completions.configure_cache(
+        os.getenv("ULTRASAFE_CACHE_PATH"),
+        ttl=float(os.getenv("ULTRASAFE_CACHE_TTL", 7 * 24 * 3600)),
+        max_entries=int(os.getenv("ULTRASAFE_CACHE_MAX_ENTRIES", 1000)),
+    )
+
+if os.getenv("ULTRASAFE_MAX_CONCURRENCY"):
+    UltraSafe.chat.Completions.configure_concurrency(int(os.getenv("ULTRASAFE_MAX_CONCURRENCY")))